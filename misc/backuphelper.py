@@ -0,0 +1,689 @@
+import errno
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import re
+import shutil
+import stat
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from util.base import *  # pylint: disable=unused-wildcard-import
+
+
+class CopyEngine:
+    # ioctl of Linux to share extents of src with dst, supported by btrfs, xfs and others
+    FICLONE = 0x40049409
+
+    def __init__(self, dst_dir, job_count=0, link_dir=''):
+        self.dst_dir = dst_dir
+        self.job_count = job_count or Util.CPU_COUNT
+        # previous counterpart of dst_dir, whose files unchanged since then are hardlinked instead of copied
+        self.link_dir = link_dir
+        self.reflink = Util.HOST_OS == Util.LINUX
+        self.lock = threading.Lock()
+        self.stats = {'reflink': 0, 'hardlink': 0, 'copy': 0, 'symlink': 0, 'fail': 0}
+        self.bytes = 0
+
+    # Copy each (src, dst) pair, where dst is the path of src itself in dst_dir rather than its parent folder. Folders
+    # are expanded so that all the files are copied by the pool, and all the folders are created ahead.
+    def copy(self, pairs):
+        time_start = time.time()
+        files = []
+        dirs = set()
+        for src, dst in pairs:
+            src = os.path.normpath(src)
+            dst = os.path.normpath(dst)
+            if os.path.isdir(src) and not os.path.islink(src):
+                for root, sub_dirs, sub_files in os.walk(src):
+                    dst_root = os.path.join(dst, os.path.relpath(root, src))
+                    dirs.add(dst_root)
+                    for sub_dir in sub_dirs:
+                        if os.path.islink(os.path.join(root, sub_dir)):
+                            files.append((os.path.join(root, sub_dir), os.path.join(dst_root, sub_dir)))
+                    for sub_file in sub_files:
+                        files.append((os.path.join(root, sub_file), os.path.join(dst_root, sub_file)))
+            elif os.path.lexists(src):
+                dirs.add(os.path.dirname(dst))
+                files.append((src, dst))
+            else:
+                Util.warning('%s does not exist' % src)
+                self.stats['fail'] += 1
+
+        for dir in sorted(dirs):
+            os.makedirs(dir, exist_ok=True)
+
+        with ThreadPoolExecutor(max_workers=self.job_count) as executor:
+            list(executor.map(lambda x: self._copy_file(*x), files))
+
+        duration = time.time() - time_start
+        Util.info(
+            'Copied %s files of %s MB in %.1fs, %.1f MB/s (%s)'
+            % (
+                len(files),
+                round(self.bytes / 1048576.0, 1),
+                duration,
+                self.bytes / 1048576.0 / max(duration, 0.001),
+                ', '.join(['%s %s' % (key, value) for key, value in self.stats.items()]),
+            )
+        )
+        return self.stats['fail'] == 0
+
+    def _copy_file(self, src, dst):
+        try:
+            if os.path.lexists(dst):
+                self._remove(dst)
+            if os.path.islink(src):
+                os.symlink(os.readlink(src), dst)
+                self._count('symlink', 0)
+                return
+
+            # reflink first, as it shares extents without sharing the inode, then hardlink to previous backup
+            size = os.path.getsize(src)
+            if self.reflink and self._reflink(src, dst):
+                self._count('reflink', size)
+            elif self.link_dir and self._link(src, dst):
+                self._count('hardlink', 0)
+            else:
+                shutil.copy2(src, dst)
+                self._count('copy', size)
+        except Exception as e:
+            Util.warning('Failed to copy %s to %s: %s' % (src, dst, e))
+            self._count('fail', 0)
+
+    # file is unchanged if the copy in previous backup has the same size and mtime, which copy2 and reflink keep
+    def _link(self, src, dst):
+        prev = os.path.join(self.link_dir, os.path.relpath(dst, self.dst_dir))
+        try:
+            stat_src = os.stat(src)
+            stat_prev = os.stat(prev)
+        except OSError:
+            return False
+        if stat_src.st_size != stat_prev.st_size or int(stat_src.st_mtime) != int(stat_prev.st_mtime):
+            return False
+        try:
+            os.link(prev, dst)
+        except OSError:
+            return False
+        return True
+
+    def _reflink(self, src, dst):
+        import fcntl
+
+        fd_src = os.open(src, os.O_RDONLY)
+        try:
+            fd_dst = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                fcntl.ioctl(fd_dst, self.FICLONE, fd_src)
+            except OSError as e:
+                os.close(fd_dst)
+                os.remove(dst)
+                # filesystem does not support it, so never try again
+                if e.errno in [errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY]:
+                    self.reflink = False
+                return False
+            os.close(fd_dst)
+        finally:
+            os.close(fd_src)
+        shutil.copystat(src, dst)
+        return True
+
+    def _count(self, key, size):
+        with self.lock:
+            self.stats[key] += 1
+            self.bytes += size
+
+    # Windows does not remove read-only files, such as the ones copied from read-only sources
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except PermissionError:
+            os.chmod(path, stat.S_IWRITE)
+            os.remove(path)
+
+
+# Content-addressed store of backups under backup_dir/.store. Each file is an object named by its hash, and each rev has
+# a manifest of its tree. Trees of revs are hardlinks to objects, so files identical across revs take space only once.
+# Objects are read-only, as they are shared by revs and none of them should be changed in place, and CopyEngine replaces
+# files instead of writing them. Read-only bit is only cleared to remove trees and objects.
+class BackupStore:
+    STORE_DIR = '.store'
+
+    def __init__(self, backup_dir, job_count=0):
+        self.backup_dir = backup_dir
+        self.objects_dir = '%s/%s/objects' % (backup_dir, self.STORE_DIR)
+        self.manifests_dir = '%s/%s/manifests' % (backup_dir, self.STORE_DIR)
+        self.job_count = job_count or Util.CPU_COUNT
+        Util.ensure_dir(self.objects_dir)
+        Util.ensure_dir(self.manifests_dir)
+
+    # Move files of backup_dir/rev_dir into store, and replace them with hardlinks to objects
+    def add(self, rev_dir):
+        time_start = time.time()
+        tree_dir = '%s/%s' % (self.backup_dir, rev_dir)
+        manifest = {'files': {}, 'links': {}, 'dirs': []}
+        paths = []
+        for root, dirs, files in os.walk(tree_dir):
+            rel_root = os.path.relpath(root, tree_dir).replace('\\', '/')
+            if not dirs and not files:
+                manifest['dirs'].append(rel_root)
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                rel_path = name if rel_root == '.' else '%s/%s' % (rel_root, name)
+                if os.path.islink(path):
+                    manifest['links'][rel_path] = os.readlink(path)
+                elif name in files:
+                    paths.append([path, rel_path])
+
+        with ThreadPoolExecutor(max_workers=self.job_count) as executor:
+            keys = list(executor.map(lambda x: self._add_file(x[0]), paths))
+
+        size_new = 0
+        size_total = 0
+        for (path, rel_path), (key, size, is_new) in zip(paths, keys):
+            manifest['files'][rel_path] = key
+            size_total += size
+            if is_new:
+                size_new += size
+        self._write_manifest(rev_dir, manifest)
+        Util.info(
+            'Stored %s files of %s MB for %s in %.1fs, %s MB are new'
+            % (
+                len(paths),
+                round(size_total / 1048576.0, 1),
+                rev_dir,
+                time.time() - time_start,
+                round(size_new / 1048576.0, 1),
+            )
+        )
+
+    # Recreate tree of rev_dir from its manifest, for example after the tree is removed to save inodes
+    def materialize(self, rev_dir):
+        manifest = self._read_manifest(rev_dir)
+        tree_dir = '%s/%s' % (self.backup_dir, rev_dir)
+        for rel_dir in manifest['dirs']:
+            Util.ensure_dir('%s/%s' % (tree_dir, rel_dir))
+        for rel_path, key in manifest['files'].items():
+            path = '%s/%s' % (tree_dir, rel_path)
+            if os.path.exists(path):
+                continue
+            Util.ensure_dir(os.path.dirname(path))
+            os.link(self._get_object(key), path)
+        for rel_path, target in manifest['links'].items():
+            path = '%s/%s' % (tree_dir, rel_path)
+            if os.path.lexists(path):
+                continue
+            Util.ensure_dir(os.path.dirname(path))
+            os.symlink(target, path)
+        Util.info('Materialized %s with %s files' % (rev_dir, len(manifest['files'])))
+
+    # relative paths of files and links in tree of rev_dir
+    def get_files(self, rev_dir):
+        manifest = self._read_manifest(rev_dir)
+        return set(manifest['files']) | set(manifest['links'])
+
+    # Forget rev_dir, whose tree is removed as well, and its objects are removed by gc() if no other rev refers to them
+    def remove(self, rev_dir):
+        manifest_file = '%s/%s.json' % (self.manifests_dir, rev_dir)
+        keys = set()
+        if os.path.exists(manifest_file):
+            keys = set(self._read_manifest(rev_dir)['files'].values())
+        Util.ensure_nofile(manifest_file)
+        tree_dir = '%s/%s' % (self.backup_dir, rev_dir)
+        if os.path.exists(tree_dir):
+            shutil.rmtree(tree_dir, onerror=self._on_remove_error)
+        # mode is shared by hardlinks, so objects lose read-only bit if their links are removed on Windows
+        for key in keys:
+            obj = self._get_object(key)
+            if os.path.exists(obj):
+                self._set_readonly(obj)
+
+    # Remove objects not referred by any manifest
+    def gc(self):
+        keys = set()
+        for manifest_file in os.listdir(self.manifests_dir):
+            keys.update(self._read_manifest(os.path.splitext(manifest_file)[0])['files'].values())
+
+        count = 0
+        size = 0
+        for prefix in os.listdir(self.objects_dir):
+            for name in os.listdir('%s/%s' % (self.objects_dir, prefix)):
+                if prefix + name in keys:
+                    continue
+                path = '%s/%s/%s' % (self.objects_dir, prefix, name)
+                size += os.path.getsize(path)
+                CopyEngine._remove(path)
+                count += 1
+            if not os.listdir('%s/%s' % (self.objects_dir, prefix)):
+                os.rmdir('%s/%s' % (self.objects_dir, prefix))
+        Util.info('Removed %s objects of %s MB' % (count, round(size / 1048576.0, 1)))
+
+    # Object key is the hash of content, with suffix x for executable, as mode is shared by all the hardlinks
+    def _add_file(self, path):
+        sha = hashlib.sha256()
+        f = open(path, 'rb')
+        while True:
+            data = f.read(1 << 20)
+            if not data:
+                break
+            sha.update(data)
+        f.close()
+        mode = os.stat(path).st_mode
+        key = sha.hexdigest()
+        if mode & stat.S_IXUSR:
+            key += 'x'
+
+        obj = self._get_object(key)
+        size = os.path.getsize(path)
+        if os.path.exists(obj):
+            if not os.path.samefile(obj, path):
+                tmp_path = '%s.tmp' % path
+                os.link(obj, tmp_path)
+                os.replace(tmp_path, path)
+            return key, size, False
+
+        os.makedirs(os.path.dirname(obj), exist_ok=True)
+        try:
+            os.link(path, obj)
+        except FileExistsError:
+            # another thread stores the same content
+            return self._add_file(path)
+        self._set_readonly(obj)
+        return key, size, True
+
+    def _get_object(self, key):
+        return '%s/%s/%s' % (self.objects_dir, key[:2], key[2:])
+
+    @staticmethod
+    def _set_readonly(path):
+        os.chmod(path, os.stat(path).st_mode & ~(stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH))
+
+    # Windows does not remove read-only files
+    @staticmethod
+    def _on_remove_error(func, path, exc_info):
+        os.chmod(path, stat.S_IWRITE)
+        func(path)
+
+    def _read_manifest(self, rev_dir):
+        manifest_file = '%s/%s.json' % (self.manifests_dir, rev_dir)
+        if not os.path.exists(manifest_file):
+            Util.error('Backup store does not have %s' % rev_dir)
+        f = open(manifest_file)
+        manifest = json.load(f)
+        f.close()
+        return manifest
+
+    def _write_manifest(self, rev_dir, manifest):
+        manifest_file = '%s/%s.json' % (self.manifests_dir, rev_dir)
+        f = open('%s.tmp' % manifest_file, 'w')
+        json.dump(manifest, f, sort_keys=True)
+        f.close()
+        os.replace('%s.tmp' % manifest_file, manifest_file)
+
+
+# Destination of upload in a local folder
+class LocalDestination:
+    def __init__(self, dir):
+        self.dir = dir
+        Util.ensure_dir(dir)
+
+    def read(self, name):
+        path = '%s/%s' % (self.dir, name)
+        if not os.path.exists(path):
+            return None
+        f = open(path, 'rb')
+        data = f.read()
+        f.close()
+        return data
+
+    def write(self, name, data):
+        path = '%s/%s' % (self.dir, name)
+        f = open('%s.tmp' % path, 'wb')
+        f.write(data)
+        f.close()
+        os.replace('%s.tmp' % path, path)
+
+    def exists(self, name):
+        return os.path.exists('%s/%s' % (self.dir, name))
+
+    def apply_delta(self, name, delta_name, manifest_name):
+        _apply_delta(self.dir, name, delta_name, manifest_name)
+
+    def concat(self, name, parts):
+        path = '%s/%s' % (self.dir, name)
+        f = open('%s.tmp' % path, 'wb')
+        for part in parts:
+            f_part = open('%s/%s' % (self.dir, part), 'rb')
+            shutil.copyfileobj(f_part, f, 1 << 20)
+            f_part.close()
+        f.close()
+        os.replace('%s.tmp' % path, path)
+
+    # names that do not exist are ignored
+    def remove(self, names):
+        for name in names:
+            Util.ensure_nofile('%s/%s' % (self.dir, name))
+
+
+# Destination of upload in a folder of ssh server, in format of user@host:/path
+class ScpDestination:
+    def __init__(self, address):
+        self.host, self.dir = address.split(':', 1)
+        self.dir = self.dir.rstrip('/')
+        self._ssh('mkdir -p %s' % self.dir)
+
+    def read(self, name):
+        process = subprocess.run(['ssh', self.host, 'cat %s/%s' % (self.dir, name)], capture_output=True)
+        if process.returncode:
+            return None
+        return process.stdout
+
+    def write(self, name, data):
+        fd, tmp_file = tempfile.mkstemp(prefix='gnp-upload-')
+        os.write(fd, data)
+        os.close(fd)
+        try:
+            subprocess.run(['scp', '-q', tmp_file, '%s:%s/%s' % (self.host, self.dir, name)], check=True)
+        finally:
+            os.remove(tmp_file)
+
+    def concat(self, name, parts):
+        parts = ' '.join(parts)
+        self._ssh('cd %s && cat %s > %s.tmp && mv %s.tmp %s' % (self.dir, parts, name, name, name))
+
+    def remove(self, names):
+        self._ssh('cd %s && rm -f %s' % (self.dir, ' '.join(names)))
+
+    def exists(self, name):
+        return subprocess.run(['ssh', self.host, 'test -e %s/%s' % (self.dir, name)]).returncode == 0
+
+    # server only needs python3, as the code of _apply_delta is sent along
+    def apply_delta(self, name, delta_name, manifest_name):
+        script = inspect.getsource(_apply_delta) + '\n_apply_delta(%r, %r, %r, %r)\n' % (
+            self.dir,
+            name,
+            delta_name,
+            manifest_name,
+        )
+        subprocess.run(['ssh', self.host, 'python3', '-'], input=script.encode('utf-8'), check=True)
+
+    def _ssh(self, cmd):
+        subprocess.run(['ssh', self.host, cmd], check=True)
+
+
+def get_destination(address):
+    # drive letter of Windows is not a host
+    if re.match(r'[^/\\]+:', address) and not re.match(r'[a-zA-Z]:[/\\]', address):
+        return ScpDestination(address)
+    return LocalDestination(address)
+
+
+# Tar a folder as stream, compress blocks of chunk_size in parallel as independent gzip members, and write each
+# compressed block as a chunk to destination once the ones before it are written, so compression overlaps the transfer.
+# Concatenation of the chunks is a valid tar.gz, which destination does at the end. The manifest records checksums of
+# each block and chunk, so an interrupted upload of the same folder skips the chunks already written.
+class StreamUploader:
+    # raw blocks held for compression and writing, whatever the count of CPUs
+    MAX_PENDING_SIZE = 512 << 20
+
+    def __init__(self, dest, chunk_size=64 << 20, job_count=0):
+        self.dest = dest
+        self.chunk_size = chunk_size
+        self.max_pending = max(1, self.MAX_PENDING_SIZE // chunk_size)
+        self.job_count = min(job_count or Util.CPU_COUNT, self.max_pending)
+
+    # members are paths relative to src_dir to upload instead of the whole folder
+    def upload(self, src_dir, name, members=None):
+        time_start = time.time()
+        self.name = name
+        self.manifest_name = '%s.manifest.json' % name
+        data = self.dest.read(self.manifest_name)
+        manifest = json.loads(data.decode('utf-8')) if data else {}
+        if manifest.get('chunk_size') != self.chunk_size:
+            manifest = {'chunk_size': self.chunk_size, 'chunks': []}
+        if manifest.get('complete'):
+            # chunks may be left if previous upload is interrupted after it completes
+            self.dest.remove(self._get_parts(manifest))
+            Util.info('%s has been uploaded' % name)
+            return
+        self.manifest = manifest
+        self.index = 0
+        self.pending = []
+        self.stats = {'raw': 0, 'sent': 0, 'resumed': 0}
+
+        with ThreadPoolExecutor(max_workers=self.job_count) as executor:
+            self.executor = executor
+            writer = _BlockWriter(self.chunk_size, self._add_block)
+            tar = tarfile.open(fileobj=writer, mode='w|')
+            root = os.path.basename(src_dir.rstrip('/'))
+            if members is None:
+                tar.add(src_dir, arcname=root)
+            else:
+                for member in members:
+                    tar.add('%s/%s' % (src_dir, member), arcname='%s/%s' % (root, member), recursive=False)
+            tar.close()
+            writer.close()
+            while self.pending:
+                self._write_chunk()
+
+        # chunks are removed only after manifest is complete, so a resumed upload never counts on removed chunks
+        parts = self._get_parts(self.manifest)
+        self.dest.concat(name, parts)
+        self.manifest['complete'] = True
+        self.dest.write(self.manifest_name, json.dumps(self.manifest).encode('utf-8'))
+        self.dest.remove(parts)
+        duration = time.time() - time_start
+        Util.info(
+            'Uploaded %s of %s MB as %s chunks in %.1fs, %s MB are sent and %s chunks are resumed'
+            % (
+                name,
+                round(self.stats['raw'] / 1048576.0, 1),
+                len(parts),
+                duration,
+                round(self.stats['sent'] / 1048576.0, 1),
+                self.stats['resumed'],
+            )
+        )
+
+    def _get_parts(self, manifest):
+        return ['%s.%05d' % (self.name, i) for i in range(len(manifest['chunks']))]
+
+    def _add_block(self, block):
+        index = self.index
+        self.index += 1
+        self.stats['raw'] += len(block)
+        sha_raw = hashlib.sha256(block).hexdigest()
+        chunks = self.manifest['chunks']
+        if index < len(chunks) and chunks[index]['raw'] == sha_raw:
+            self.stats['resumed'] += 1
+            return
+        # chunks after the first changed one are not valid any more
+        del chunks[index:]
+        self.pending.append([index, sha_raw, self.executor.submit(gzip.compress, block, 6, mtime=0)])
+        # limit blocks in memory, and write the oldest chunk while the others are compressed
+        while len(self.pending) > self.max_pending:
+            self._write_chunk()
+
+    def _write_chunk(self):
+        index, sha_raw, future = self.pending.pop(0)
+        chunk = future.result()
+        self.dest.write('%s.%05d' % (self.name, index), chunk)
+        sha = hashlib.sha256(chunk).hexdigest()
+        self.manifest['chunks'].append({'raw': sha_raw, 'sha256': sha, 'size': len(chunk)})
+        self.dest.write(self.manifest_name, json.dumps(self.manifest).encode('utf-8'))
+        self.stats['sent'] += len(chunk)
+
+
+# File-like object for tarfile stream, which hands out blocks of block_size
+class _BlockWriter:
+    def __init__(self, block_size, callback):
+        self.block_size = block_size
+        self.callback = callback
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self.callback(bytes(self.buffer[: self.block_size]))
+            del self.buffer[: self.block_size]
+        return len(data)
+
+    def close(self):
+        if self.buffer:
+            self.callback(bytes(self.buffer))
+            self.buffer = bytearray()
+
+
+# Upload only the files whose content is not in the newest rev already at destination, and let destination rebuild the
+# full archive of rev from archive of that rev and the delta. The catalog records file hashes of each rev uploaded to
+# destination, so nothing needs to be read back from it.
+class DeltaUploader:
+    def __init__(self, dest, catalog_file, job_count=0):
+        self.dest = dest
+        self.catalog_file = catalog_file
+        self.job_count = job_count or Util.CPU_COUNT
+        if os.path.exists(catalog_file):
+            f = open(catalog_file)
+            self.catalog = json.load(f)
+            f.close()
+        else:
+            self.catalog = {}
+
+    def upload(self, src_dir, name):
+        root = os.path.basename(src_dir.rstrip('/'))
+        tree = self._get_tree(src_dir)
+        base_name = ''
+        for catalog_name in sorted(self.catalog, key=lambda x: self.catalog[x]['time'], reverse=True):
+            if catalog_name == name:
+                continue
+            if self.dest.exists(catalog_name):
+                base_name = catalog_name
+                break
+
+        if not base_name:
+            Util.info('Destination does not have any rev in catalog, so upload the whole %s' % name)
+            StreamUploader(self.dest, job_count=self.job_count).upload(src_dir, name)
+        else:
+            base = self.catalog[base_name]
+            base_paths = {}
+            for rel_path, sha in base['files'].items():
+                base_paths.setdefault(sha, rel_path)
+            changed = []
+            sources = {}
+            size = 0
+            for rel_path, sha in tree['files'].items():
+                if sha in base_paths:
+                    sources[rel_path] = base_paths[sha]
+                else:
+                    changed.append(rel_path)
+                    size += os.path.getsize('%s/%s' % (src_dir, rel_path))
+            Util.info(
+                'Begin to upload %s as delta of %s, with %s of %s files changed in %s MB'
+                % (name, base_name, len(changed), len(tree['files']), round(size / 1048576.0, 1))
+            )
+
+            delta_name = name.replace('.tar.gz', '') + '.delta.tar.gz'
+            manifest_name = name.replace('.tar.gz', '') + '.delta.json'
+            StreamUploader(self.dest, job_count=self.job_count).upload(src_dir, delta_name, sorted(changed))
+            manifest = {
+                'base': base_name,
+                'base_root': base['root'],
+                'root': root,
+                'delta': delta_name,
+                'sources': sources,
+                'links': tree['links'],
+                'dirs': tree['dirs'],
+            }
+            self.dest.write(manifest_name, json.dumps(manifest).encode('utf-8'))
+            self.dest.apply_delta(name, delta_name, manifest_name)
+
+        tree['root'] = root
+        tree['time'] = time.time()
+        self.catalog[name] = tree
+        Util.ensure_dir(os.path.dirname(self.catalog_file))
+        f = open('%s.tmp' % self.catalog_file, 'w')
+        json.dump(self.catalog, f)
+        f.close()
+        os.replace('%s.tmp' % self.catalog_file, self.catalog_file)
+
+    def _get_tree(self, src_dir):
+        tree = {'files': {}, 'links': {}, 'dirs': []}
+        paths = []
+        for root, dirs, files in os.walk(src_dir):
+            rel_root = os.path.relpath(root, src_dir).replace('\\', '/')
+            if not dirs and not files:
+                tree['dirs'].append(rel_root)
+            for name in dirs + files:
+                path = os.path.join(root, name)
+                rel_path = name if rel_root == '.' else '%s/%s' % (rel_root, name)
+                if os.path.islink(path):
+                    tree['links'][rel_path] = os.readlink(path)
+                elif name in files:
+                    paths.append([path, rel_path])
+
+        def get_hash(path):
+            sha = hashlib.sha256()
+            f = open(path, 'rb')
+            while True:
+                data = f.read(1 << 20)
+                if not data:
+                    break
+                sha.update(data)
+            f.close()
+            return sha.hexdigest()
+
+        with ThreadPoolExecutor(max_workers=self.job_count) as executor:
+            hashes = list(executor.map(lambda x: get_hash(x[0]), paths))
+        for (path, rel_path), sha in zip(paths, hashes):
+            tree['files'][rel_path] = sha
+        return tree
+
+
+# Rebuild archive name from the archive of base rev and the delta, in folder dir of destination. It runs on the server
+# for ScpDestination, so it only depends on python standard library.
+def _apply_delta(dir, name, delta_name, manifest_name):
+    import json
+    import os
+    import shutil
+    import tarfile
+
+    f = open('%s/%s' % (dir, manifest_name))
+    manifest = json.load(f)
+    f.close()
+    tmp_dir = '%s/.%s.tmp' % (dir, name)
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for archive, sub_dir in [[manifest['base'], 'base'], [delta_name, 'delta']]:
+        tar = tarfile.open('%s/%s' % (dir, archive))
+        tar.extractall('%s/%s' % (tmp_dir, sub_dir))
+        tar.close()
+
+    root = manifest['root']
+    tree_dir = '%s/delta/%s' % (tmp_dir, root)
+    os.makedirs(tree_dir, exist_ok=True)
+    for rel_path, base_path in manifest['sources'].items():
+        path = '%s/%s' % (tree_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copy2('%s/base/%s/%s' % (tmp_dir, manifest['base_root'], base_path), path)
+    for rel_path, target in manifest['links'].items():
+        path = '%s/%s' % (tree_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.symlink(target, path)
+    for rel_dir in manifest['dirs']:
+        os.makedirs('%s/%s' % (tree_dir, rel_dir), exist_ok=True)
+
+    tar = tarfile.open('%s/%s.tmp' % (dir, name), 'w:gz')
+    tar.add(tree_dir, arcname=root)
+    tar.close()
+    os.replace('%s/%s.tmp' % (dir, name), '%s/%s' % (dir, name))
+    shutil.rmtree(tmp_dir)
+    for file in [delta_name, delta_name + '.manifest.json', manifest_name]:
+        if os.path.exists('%s/%s' % (dir, file)):
+            os.remove('%s/%s' % (dir, file))
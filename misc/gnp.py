@@ -1,3 +1,4 @@
+import hashlib
 import os
 import platform
 import re
@@ -30,6 +31,7 @@ sys.path.append(script_dir)
 sys.path.append(script_dir + '/..')
 
 from util.base import *  # pylint: disable=unused-wildcard-import
+from misc.backuphelper import *
 
 
 class Gnp(Program):
@@ -112,7 +114,38 @@ class Gnp(Program):
         parser.add_argument('--backup-inplace', dest='backup_inplace', help='backup inplace', action='store_true')
         parser.add_argument('--backup-symbol', dest='backup_symbol', help='backup symbol', action='store_true')
         parser.add_argument('--backup-target', dest='backup_target', help='backup target')
+        parser.add_argument(
+            '--backup-store',
+            dest='backup_store',
+            help='keep backup in content-addressed store, so that files identical across revs are shared',
+            action='store_true',
+        )
+        parser.add_argument(
+            '--backup-store-remove', dest='backup_store_remove', help='remove backup dir of rev from store'
+        )
+        parser.add_argument(
+            '--backup-store-materialize',
+            dest='backup_store_materialize',
+            help='recreate backup dir of rev from store',
+        )
+        parser.add_argument(
+            '--backup-store-gc',
+            dest='backup_store_gc',
+            help='remove unreferenced objects of store',
+            action='store_true',
+        )
         parser.add_argument('--upload', dest='upload', help='upload', action='store_true')
+        parser.add_argument(
+            '--upload-dest',
+            dest='upload_dest',
+            help='upload destination, can be user@host:/path or a local folder. Default is the backup server',
+        )
+        parser.add_argument(
+            '--upload-delta',
+            dest='upload_delta',
+            help='only upload files changed since the newest rev at destination, which rebuilds the full archive',
+            action='store_true',
+        )
         parser.add_argument('--run', dest='run', help='run', action='store_true')
         parser.add_argument('--run-target', dest='run_target', help='run target')
         parser.add_argument('--run-output', dest='run_output', help='run output file')
@@ -121,11 +154,42 @@ class Gnp(Program):
         parser.add_argument('--run-filter', dest='run_filter', help='run filter', default='all')
         parser.add_argument('--run-rev', dest='run_rev', help='run rev', default='out')
         parser.add_argument('--run-mesa-rev', dest='run_mesa_rev', help='mesa revision', default='system')
+        parser.add_argument(
+            '--bisect',
+            dest='bisect',
+            help='find the first bad rev in --rev min-max, where min is good and max is bad',
+            action='store_true',
+        )
+        parser.add_argument(
+            '--bisect-cmd',
+            dest='bisect_cmd',
+            help='command to check rev in its backup dir, which fails on bad rev. Default is to run --run-target',
+        )
+        parser.add_argument(
+            '--bisect-perf-pattern',
+            dest='bisect_perf_pattern',
+            help='regex to get perf value from output of check as group 1, so that rev is checked against threshold',
+        )
+        parser.add_argument(
+            '--bisect-perf-threshold', dest='bisect_perf_threshold', help='perf threshold', type=float, default=0
+        )
+        parser.add_argument(
+            '--bisect-perf-bad',
+            dest='bisect_perf_bad',
+            help='perf value above or below threshold is bad',
+            choices=['above', 'below'],
+            default='above',
+        )
 
         parser.epilog = '''
 examples:
 {0} {1} --sync --runhooks --makefile --build --backup --build --run --download
 {0} {1} --backup --root-dir d:/workspace/chrome
+{0} {1} --rev 1000-1200 --sync --runhooks --build --backup --backup-store # share identical files across revs
+{0} {1} --backup-store-remove <backup dir> --backup-store-gc
+{0} {1} --rev 1000 --upload --upload-delta
+{0} {1} --rev 1000-1200 --bisect --run-target angle_e2e --run-filter Texture # first rev failing the tests
+{0} {1} --rev 1000-1200 --bisect --bisect-cmd "./perf_test" --bisect-perf-pattern "time: (\\d+\\.?\\d*)" --bisect-perf-threshold 10
 {0} {1} --disable-component-build --symbol-level 2 --build --build-target chrome,chromedriver --backup --backup-target chrome,chromedriver --backup-symbol # debug
 {0} {1} --target-os android --disable-component-build --sync --runhooks --build # android
 '''.format(
@@ -215,7 +279,9 @@ examples:
             if '.' in min_rev and '.' not in max_rev or '.' not in min_rev and '.' in max_rev:
                 Util.error('min_rev and max_rev should be in same format')
 
-            if '.' in min_rev:
+            if args.bisect:
+                self.bisect(min_rev, max_rev)
+            elif '.' in min_rev:
                 integer_rev = int(float(min_rev)) + 1
                 self.integer_rev = integer_rev
                 self.repo.get_info(integer_rev, integer_rev, 'main')
@@ -255,23 +321,25 @@ examples:
             if self.rev:
                 Util.info('Begin to sync rev %s' % self.rev)
 
+            ret = 0
             if self.args.sync_reset:
-                self._execute('git reset --hard HEAD && git clean -fd', exit_on_error=self.exit_on_error)
+                ret = self._execute('git reset --hard HEAD && git clean -fd', exit_on_error=self.exit_on_error)[0]
 
             if self.integer_rev:
                 self.repo.get_info(self.integer_rev, self.integer_rev, 'main')
-            self._chromium_sync_integer_rev()
+            ret = ret or self._chromium_sync_integer_rev()
             if not self.integer_rev:
                 self.integer_rev = self.repo.get_working_dir_rev()
                 self.repo.get_info(self.integer_rev, self.integer_rev, 'main')
             if self.decimal_rev:
-                self._chromium_sync_decimal_rev()
+                ret = ret or self._chromium_sync_decimal_rev()
+            return ret
         else:
-            self._execute('git pull --no-recurse-submodules', exit_on_error=self.exit_on_error)
-            self._execute_gclient(cmd_type='sync')
+            ret = self._execute('git pull --no-recurse-submodules', exit_on_error=self.exit_on_error)[0]
+            return ret or self._execute_gclient(cmd_type='sync')
 
     def runhooks(self):
-        self._execute_gclient(cmd_type='runhooks')
+        return self._execute_gclient(cmd_type='runhooks')
 
     def makefile(self):
         args = self.args
@@ -336,7 +404,7 @@ examples:
         cmd += ' gen %s' % self.out_dir
         Util.ensure_dir(self.out_dir)
         Util.info('GN ARGS: {}'.format(gn_args))
-        self._execute(cmd, exit_on_error=self.exit_on_error)
+        return self._execute(cmd, exit_on_error=self.exit_on_error)[0]
 
     def build(self):
         build_target = self.args.build_target
@@ -367,7 +435,7 @@ examples:
         )
         if self.args.build_verbose:
             cmd += ' -v'
-        self._execute(cmd, show_duration=True)
+        return self._execute(cmd, exit_on_error=self.exit_on_error, show_duration=True)[0]
 
     def backup(self):
         if self.project == 'chromium':
@@ -380,6 +448,16 @@ examples:
             rev_dir = Util.cal_backup_dir()
         backup_path = '%s/%s' % (self.backup_dir, rev_dir)
         Util.ensure_dir(self.backup_dir)
+        # the newest backup of another rev, to hardlink files that have not changed since then
+        prev_backups = [
+            '%s/%s' % (self.backup_dir, x)
+            for x in os.listdir(self.backup_dir)
+            if x != rev_dir and not x.startswith('.') and os.path.isdir('%s/%s' % (self.backup_dir, x))
+        ]
+        if prev_backups:
+            link_dir = max(prev_backups, key=os.path.getmtime)
+        else:
+            link_dir = ''
 
         Util.info('Begin to backup %s' % rev_dir)
         if os.path.exists(backup_path) and not self.args.backup_inplace:
@@ -411,17 +489,7 @@ examples:
                     tmp_file += '/'
                 tmp_files.append(tmp_file)
         else:
-            for target in targets:
-                target_files = (
-                    self._execute(
-                        'gn desc %s %s runtime_deps' % (self.out_dir, target),
-                        exit_on_error=self.exit_on_error,
-                        return_out=True,
-                    )[1]
-                    .rstrip('\n')
-                    .split('\n')
-                )
-                tmp_files = Util.union_list(tmp_files, target_files)
+            tmp_files = self._get_runtime_deps(targets)
 
         # 'gen/', 'obj/', '../../testing/test_env.py', '../../testing/location_tags.json', '../../.vpython'
         exclude_files = []
@@ -457,22 +525,26 @@ examples:
                 'out/%s/../../testing/buildbot/chromium.dawn.json' % self.build_type_cap,
             ]
 
-        src_file_count = len(src_files)
-        for index, src_file in enumerate(src_files):
+        pairs = []
+        for src_file in src_files:
             dst_file = '%s/%s' % (backup_path, src_file)
             # dst_file can be subfolder of another dst_file, so only file can be skipped
             if self.args.backup_inplace and os.path.isfile(dst_file):
-                Util.info(f'[{index + 1}/{src_file_count}] skip {dst_file}')
                 continue
-            Util.ensure_dir(os.path.dirname(dst_file))
-            if os.path.isdir(src_file):
-                dst_file = os.path.dirname(dst_file.rstrip('/'))
-            cmd = 'cp -rf %s %s' % (src_file, dst_file)
-            Util.info('[%s/%s] %s' % (index + 1, src_file_count, cmd))
-            self._execute(cmd, exit_on_error=False, show_cmd=False)
-
-            # permission denied
-            # shutil.copyfile(file, dst_dir)
+            pairs.append([src_file, dst_file.rstrip('/')])
+        Util.info('Begin to copy %s of %s files or folders' % (len(pairs), len(src_files)))
+        CopyEngine(backup_path, link_dir=link_dir).copy(pairs)
+        if self.args.backup_store:
+            BackupStore(self.backup_dir).add(rev_dir)
+
+    def backup_store(self):
+        store = BackupStore(self.backup_dir)
+        if self.args.backup_store_remove:
+            store.remove(self.args.backup_store_remove)
+        if self.args.backup_store_materialize:
+            store.materialize(self.args.backup_store_materialize)
+        if self.args.backup_store_gc:
+            store.gc()
 
     def upload(self):
         if self.rev:
@@ -481,26 +553,31 @@ examples:
             rev = 'latest'
         rev_name, _ = Util.get_backup_dir(self.backup_dir, rev)
         rev_dir = '%s/%s' % (self.backup_dir, rev_name)
-        if Util.HOST_OS == Util.LINUX:
-            rev_backup_file = '%s.tar.gz' % rev_dir
-            if not os.path.exists(rev_backup_file):
-                Util.chdir(self.backup_dir)
-                Util.execute('tar zcf %s.tar.gz %s' % (rev_name, rev_name))
-        elif Util.HOST_OS == Util.WINDOWS:
-            rev_backup_file = '%s.zip' % rev_dir
-            if not os.path.exists(rev_backup_file):
-                shutil.make_archive(rev_dir, 'zip', rev_dir)
-
-        relative_path = (
-            self.root_dir[self.root_dir.index('project') + len('project') + 1 :].replace('\\', '/').replace('/src', '')
-        )
-        if Util.check_server_backup(relative_path, os.path.basename(rev_backup_file)):
-            Util.info('Server already has rev %s' % rev_backup_file)
+        rev_backup_file = '%s.tar.gz' % rev_name
+
+        if self.args.upload_dest:
+            upload_dest = self.args.upload_dest
         else:
-            Util.execute(
-                'scp %s wp@%s:/workspace/backup/%s/%s/'
-                % (rev_backup_file, Util.BACKUP_SERVER, Util.HOST_OS, relative_path)
+            relative_path = (
+                self.root_dir[self.root_dir.index('project') + len('project') + 1 :]
+                .replace('\\', '/')
+                .replace('/src', '')
             )
+            # Windows used to upload zip instead of tar.gz
+            for backup_file in [rev_backup_file, '%s.zip' % rev_name]:
+                if Util.check_server_backup(relative_path, backup_file):
+                    Util.info('Server already has rev %s' % backup_file)
+                    return
+            upload_dest = 'wp@%s:/workspace/backup/%s/%s' % (Util.BACKUP_SERVER, Util.HOST_OS, relative_path)
+        if self.args.upload_delta:
+            # catalog of what each destination has, which is only updated by delta upload
+            catalog_file = '%s/.catalog/%s.json' % (
+                self.backup_dir,
+                hashlib.sha1(upload_dest.encode('utf-8')).hexdigest()[:16],
+            )
+            DeltaUploader(get_destination(upload_dest), catalog_file).upload(rev_dir, rev_backup_file)
+        else:
+            StreamUploader(get_destination(upload_dest)).upload(rev_dir, rev_backup_file)
 
     def run(self):
         if Util.HOST_OS == Util.LINUX and self.args.run_mesa_rev == 'latest':
@@ -595,6 +672,153 @@ examples:
         self.backup()
         self.run()
 
+    # Binary search the first bad rev, where min_rev is good and max_rev is bad. Existing backups are reused, and revs
+    # failing to build are skipped. If the first bad integer rev is a roll, search goes on among its decimal revs.
+    def bisect(self, min_rev, max_rev):
+        if self.project != 'chromium':
+            Util.error('Bisect only supports chromium')
+        self.exit_on_error = False
+        self.bisect_results = {}
+
+        # as with --rev, n.x is rev n with the first x commits of the roll in rev n+1
+        if '.' in min_rev:
+            base_rev = int(min_rev.split('.')[0])
+            roll_count = self._get_roll_count(base_rev + 1)
+            if roll_count <= 1:
+                Util.error('Rev %s cannot be built as a roll' % (base_rev + 1))
+            min_decimal = int(min_rev.split('.')[1])
+            max_decimal = min(int(max_rev.split('.')[1]), roll_count - 1)
+            revs = ['%s.%s' % (base_rev, x) for x in range(min_decimal, max_decimal + 1)]
+        else:
+            revs = [str(x) for x in range(int(min_rev), int(max_rev) + 1)]
+        first_bad = self._bisect_revs(revs)
+
+        if first_bad and '.' not in first_bad:
+            integer_rev = int(first_bad)
+            roll_count = self._get_roll_count(integer_rev)
+            if roll_count > 1:
+                Util.info('Rev %s rolls %s commits, so bisect among them' % (first_bad, roll_count))
+                revs = (
+                    [str(integer_rev - 1)]
+                    + ['%s.%s' % (integer_rev - 1, x) for x in range(1, roll_count)]
+                    + [first_bad]
+                )
+                first_bad = self._bisect_revs(revs)
+
+        checked = len([x for x in self.bisect_results.values() if x != 'skip'])
+        Util.info(
+            'Bisect checked %s revs and skipped %s: %s'
+            % (
+                checked,
+                len(self.bisect_results) - checked,
+                ', '.join(['%s %s' % (key, value) for key, value in self.bisect_results.items()]),
+            )
+        )
+        if first_bad:
+            Util.info('The first bad rev is %s' % first_bad)
+
+    def _bisect_revs(self, revs):
+        good = 0
+        bad = len(revs) - 1
+        for index, expected in [[good, 'good'], [bad, 'bad']]:
+            result = self._bisect_check(revs[index])
+            if result != expected:
+                Util.error('Rev %s should be %s, but it is %s' % (revs[index], expected, result))
+
+        while bad - good > 1:
+            # the rev nearest to the middle that is not skipped
+            mid = (good + bad) // 2
+            result = 'skip'
+            for index in sorted(range(good + 1, bad), key=lambda x: (abs(x - mid), x)):
+                result = self._bisect_check(revs[index])
+                if result != 'skip':
+                    break
+            if result == 'skip':
+                Util.warning(
+                    'The first bad rev is one of %s, as the ones before %s are skipped'
+                    % (', '.join(revs[good + 1 : bad + 1]), revs[bad])
+                )
+                return ''
+            if result == 'good':
+                good = index
+            else:
+                bad = index
+            Util.info('Bisect rev %s is %s, %s revs are left' % (revs[index], result, bad - good - 1))
+        return revs[bad]
+
+    # return good, bad, or skip if rev fails to build or perf value is not found
+    def _bisect_check(self, rev):
+        if rev in self.bisect_results:
+            return self.bisect_results[rev]
+
+        self.rev = rev
+        if '.' in rev:
+            self.integer_rev = int(rev.split('.')[0]) + 1
+            self.decimal_rev = int(rev.split('.')[1])
+        else:
+            self.integer_rev = int(rev)
+            self.decimal_rev = 0
+
+        rev_dir = Util.cal_backup_dir(rev)
+        backup_path = '%s/%s' % (self.backup_dir, rev_dir)
+        targets = [
+            self.BUILD_TARGET_DICT.get(target, target)
+            for target in (self.args.run_target.split(',') if self.args.run_target else [self.default_target])
+        ]
+        # a backup may be partial or made for other targets, so it's reused only if it has files to run
+        run_files = ['out/%s/%s' % (self.build_type_cap, self._get_run_file(target)) for target in targets]
+        manifest_file = '%s/%s/manifests/%s.json' % (self.backup_dir, BackupStore.STORE_DIR, rev_dir)
+        Util.chdir(self.root_dir)
+        if all([os.path.exists('%s/%s' % (backup_path, x)) for x in run_files]):
+            Util.info('Reuse backup of rev %s' % rev)
+        elif os.path.exists(manifest_file) and set(run_files) <= BackupStore(self.backup_dir).get_files(rev_dir):
+            BackupStore(self.backup_dir).materialize(rev_dir)
+        else:
+            for step in ['sync', 'runhooks', 'makefile', 'build']:
+                if step in ['runhooks', 'makefile'] and not getattr(self.args, step):
+                    continue
+                if getattr(self, step)():
+                    Util.warning('Rev %s fails to %s, so skip it' % (rev, step))
+                    Util.chdir(self.root_dir)
+                    self.bisect_results[rev] = 'skip'
+                    return 'skip'
+            self.backup()
+
+        Util.chdir('%s/out/%s' % (backup_path, self.build_type_cap), verbose=True)
+        return_out = bool(self.args.bisect_perf_pattern)
+        if self.args.bisect_cmd:
+            ret, out = self._execute(self.args.bisect_cmd, exit_on_error=False, return_out=return_out)
+        else:
+            ret = 0
+            out = ''
+            for target in targets:
+                target_ret, target_out = self._run(target, return_out=return_out)
+                ret = ret or target_ret
+                out += target_out or ''
+        Util.chdir(self.root_dir)
+
+        if self.args.bisect_perf_pattern:
+            match = re.search(self.args.bisect_perf_pattern, out)
+            if not match:
+                Util.warning('Could not find perf value of rev %s, so skip it' % rev)
+                result = 'skip'
+            else:
+                value = float(match.group(1))
+                if self.args.bisect_perf_bad == 'above':
+                    is_bad = value > self.args.bisect_perf_threshold
+                else:
+                    is_bad = value < self.args.bisect_perf_threshold
+                result = 'bad' if is_bad else 'good'
+                Util.info('Perf value of rev %s is %s' % (rev, value))
+        else:
+            result = 'bad' if ret else 'good'
+        self.bisect_results[rev] = result
+        return result
+
+    def _get_roll_count(self, integer_rev):
+        self.repo.get_info(integer_rev, integer_rev, 'main')
+        return self.repo.info[ChromiumRepo.INFO_INDEX_REV_INFO][integer_rev][ChromiumRepo.REV_INFO_INDEX_ROLL_COUNT]
+
     def _execute_gclient(self, cmd_type, job_count=0, extra_cmd='', verbose=False):
         self._set_boto()
         cmd = 'gclient ' + cmd_type
@@ -613,10 +837,11 @@ examples:
         if self.args.proxy:
             Util.set_proxy(self.proxy_address, self.proxy_port)
 
-        self._execute(cmd=cmd, exit_on_error=self.exit_on_error)
+        ret = self._execute(cmd=cmd, exit_on_error=self.exit_on_error)[0]
 
         if not Util.has_depot_tools_in_path() and os.path.exists(Util.PROJECT_DEPOT_TOOLS_DIR):
             Util.remove_path(Util.PROJECT_DEPOT_TOOLS_DIR)
+        return ret
 
     def _chromium_sync_integer_rev(self):
         if self.integer_rev:
@@ -630,17 +855,19 @@ examples:
         if self.integer_rev:
             working_dir_rev = self.repo.get_working_dir_rev()
             if working_dir_rev == self.integer_rev:
-                return
+                return 0
             tmp_hash = self.repo.get_hash_from_rev(self.integer_rev, 'main')
 
+        ret = 0
         if tmp_hash:
             extra_cmd = '--revision src@' + tmp_hash
         else:
-            self._execute('git pull --no-recurse-submodules', exit_on_error=self.exit_on_error)
+            ret = self._execute('git pull --no-recurse-submodules', exit_on_error=self.exit_on_error)[0]
             extra_cmd = ''
 
         if not self.args.sync_src_only:
-            self._execute_gclient(cmd_type='sync', extra_cmd=extra_cmd)
+            ret = ret or self._execute_gclient(cmd_type='sync', extra_cmd=extra_cmd)
+        return ret
 
     def _chromium_sync_decimal_rev(self):
         roll_repo = self.repo.info[ChromiumRepo.INFO_INDEX_REV_INFO][self.integer_rev][
@@ -659,7 +886,7 @@ examples:
             if self.decimal_rev:
                 Util.error('Rev %s is not a roll' % self.integer_rev)
             else:
-                return
+                return 0
 
         roll_hash = self.repo.info[ChromiumRepo.INFO_INDEX_REV_INFO][self.integer_rev][
             ChromiumRepo.REV_INFO_INDEX_ROLL_HASH
@@ -669,13 +896,22 @@ examples:
             Util.error('The decimal part of rev should be less than %s' % roll_count)
         Util.chdir('%s/%s' % (self.root_dir, roll_repo))
         cmd = 'git reset --hard %s~%s' % (roll_hash, roll_count_diff)
-        self._execute(cmd, exit_on_error=self.exit_on_error)
+        ret = self._execute(cmd, exit_on_error=self.exit_on_error)[0]
         cmd = 'git rev-parse --abbrev-ref HEAD'
         branch = self._execute(cmd, show_cmd=False, exit_on_error=self.exit_on_error, return_out=True)[1].strip()
         if not branch == 'master':
             Util.error('Repo %s is not on master' % roll_repo)
+        return ret
+
+    # file in out dir that _run executes for target
+    def _get_run_file(self, target):
+        if target == 'telemetry_gpu_integration_test':
+            return 'chrome%s' % Util.EXEC_SUFFIX
+        if target == 'webgpu_blink_web_tests':
+            return 'bin/run_webgpu_blink_web_tests%s' % ('.bat' if Util.HOST_OS == Util.WINDOWS else '')
+        return target + Util.EXEC_SUFFIX
 
-    def _run(self, target):
+    def _run(self, target, return_out=False):
         if target == 'telemetry_gpu_integration_test':
             cmd = 'vpython3 ../../content/test/gpu/run_gpu_integration_test.py'
         elif target == 'webgpu_blink_web_tests':
@@ -713,7 +949,101 @@ examples:
                 cmd += ' --backend=vulkan'
             # for output, Chrome build uses --gtest_output=json:%s, standalone build uses --test-launcher-summary-output=%s
 
-        self._execute(cmd, exit_on_error=self.exit_on_error)
+        return self._execute(cmd, exit_on_error=self.exit_on_error, return_out=return_out)
+
+    # Resolve runtime_deps of all the targets with one gn gen, and cache them until args.gn or any build file changes
+    def _get_runtime_deps(self, targets):
+        cache_file = '%s/gnp_runtime_deps.json' % self.out_dir
+        fingerprint = self._get_gn_fingerprint(targets)
+        if fingerprint and os.path.exists(cache_file):
+            f = open(cache_file)
+            cache = json.load(f)
+            f.close()
+            if cache['fingerprint'] == fingerprint:
+                Util.info('Use cached runtime_deps of %s' % ','.join(targets))
+                return cache['files']
+
+        list_file = '%s/gnp_runtime_deps.list' % self.out_dir
+        f = open(list_file, 'w')
+        f.write('\n'.join(targets) + '\n')
+        f.close()
+        # gn gen leaves runtime_deps files of targets out of the list untouched, so stale ones are removed first
+        for target in targets:
+            for deps_file in self._get_runtime_deps_files(target):
+                Util.ensure_nofile(deps_file)
+        self._execute(
+            'gn gen %s --runtime-deps-list-file=%s' % (self.out_dir, list_file), exit_on_error=self.exit_on_error
+        )
+
+        files = []
+        files_set = set()
+        for target in targets:
+            deps_file = ''
+            for target_file in self._get_runtime_deps_files(target):
+                if os.path.exists(target_file):
+                    deps_file = target_file
+                    break
+            if deps_file:
+                f = open(deps_file)
+                target_files = f.read().split('\n')
+                f.close()
+            else:
+                Util.warning('Could not find runtime_deps file of %s, will use gn desc instead' % target)
+                target_files = self._execute(
+                    'gn desc %s %s runtime_deps' % (self.out_dir, target),
+                    exit_on_error=self.exit_on_error,
+                    return_out=True,
+                )[1].split('\n')
+            for target_file in target_files:
+                target_file = target_file.rstrip('\r')
+                if target_file and target_file not in files_set:
+                    files_set.add(target_file)
+                    files.append(target_file)
+
+        fingerprint = self._get_gn_fingerprint(targets)
+        if fingerprint:
+            f = open(cache_file, 'w')
+            json.dump({'fingerprint': fingerprint, 'files': files}, f)
+            f.close()
+        return files
+
+    # gn gen writes runtime_deps of executable next to it with the name of output, such as chrome.exe.runtime_deps on
+    # Windows, and the others in gen.runtime or obj folder
+    def _get_runtime_deps_files(self, target):
+        if ':' in target:
+            target_dir, target_name = target.lstrip('/').split(':')
+        else:
+            target_dir, target_name = os.path.dirname(target.lstrip('/')), os.path.basename(target)
+        deps_files = ['%s/%s%s.runtime_deps' % (self.out_dir, target_name, Util.EXEC_SUFFIX)]
+        if Util.EXEC_SUFFIX:
+            deps_files.append('%s/%s.runtime_deps' % (self.out_dir, target_name))
+        deps_files += [
+            '%s/gen.runtime/%s/%s.runtime_deps' % (self.out_dir, target_dir, target_name),
+            '%s/obj/%s/%s.runtime_deps' % (self.out_dir, target_dir, target_name),
+        ]
+        return deps_files
+
+    # build.ninja.d lists all the build files gn gen reads, whose size and mtime are hashed along with args.gn
+    def _get_gn_fingerprint(self, targets):
+        deps_file = '%s/build.ninja.d' % self.out_dir
+        args_file = '%s/args.gn' % self.out_dir
+        if not os.path.exists(deps_file) or not os.path.exists(args_file):
+            return ''
+        sha = hashlib.sha256()
+        sha.update(','.join(targets).encode('utf-8'))
+        f = open(args_file, 'rb')
+        sha.update(f.read())
+        f.close()
+        f = open(deps_file)
+        build_files = f.read().split(':', 1)[-1].split()
+        f.close()
+        for build_file in build_files:
+            try:
+                stat = os.stat('%s/%s' % (self.out_dir, build_file))
+                sha.update(('%s %s %s\n' % (build_file, stat.st_size, stat.st_mtime_ns)).encode('utf-8'))
+            except OSError:
+                return ''
+        return sha.hexdigest()
 
     def _handle_ops(self):
         args = self.args
@@ -727,6 +1057,8 @@ examples:
             self.build()
         if args.backup:
             self.backup()
+        if args.backup_store_remove or args.backup_store_materialize or args.backup_store_gc:
+            self.backup_store()
         if args.upload:
             self.upload()
         if args.run:
@@ -16,6 +16,7 @@ sys.path.append(script_dir)
 sys.path.append(script_dir + '/..')
 
 from util.base import *  # pylint: disable=unused-wildcard-import
+from misc.backuphelper import *
 
 
 class Mesa(Program):
@@ -39,6 +40,11 @@ examples:
         parser.add_argument('--build-type', dest='build_type', help='build type', default='release')
         parser.add_argument('--build-force', dest='build_force', help='no reset of source code', action='store_true')
         parser.add_argument('--upload', dest='upload', help='upload', action='store_true')
+        parser.add_argument(
+            '--upload-dest',
+            dest='upload_dest',
+            help='upload destination, can be user@host:/path or a local folder. Default is the backup server',
+        )
         parser.add_argument('--run', dest='run', help='run')
         parser.add_argument('--type', dest='type', help='type', default='iris')
         parser.add_argument(
@@ -125,17 +131,16 @@ examples:
     def upload(self):
         rev_name, _ = Util.get_backup_dir(self.backup_dir, 'latest')
         rev_dir = '%s/%s' % (self.backup_dir, rev_name)
-        rev_backup_file = '%s.tar.gz' % rev_dir
-        if not os.path.exists(rev_backup_file):
-            Util.chdir(self.backup_dir)
-            Util.execute('tar zcf %s.tar.gz %s' % (rev_name, rev_name))
+        rev_backup_file = '%s.tar.gz' % rev_name
 
-        if Util.check_server_backup('mesa', os.path.basename(rev_backup_file)):
-            Util.info('Server already has rev %s' % rev_backup_file)
+        if self.args.upload_dest:
+            upload_dest = self.args.upload_dest
         else:
-            Util.execute(
-                'scp %s wp@%s:/workspace/backup/%s/mesa/' % (rev_backup_file, Util.BACKUP_SERVER, Util.HOST_OS)
-            )
+            if Util.check_server_backup('mesa', rev_backup_file):
+                Util.info('Server already has rev %s' % rev_backup_file)
+                return
+            upload_dest = 'wp@%s:/workspace/backup/%s/mesa' % (Util.BACKUP_SERVER, Util.HOST_OS)
+        StreamUploader(get_destination(upload_dest)).upload(rev_dir, rev_backup_file)
 
     def revtohash(self):
         tmp_rev = self.args.revtohash
@@ -40,5 +40,8 @@ class aquarium(Benchmark):
         time.sleep(5)
         self.result = self.get_result_periodic(driver)
 
+    def get_result_script(self):
+        return "parseFloat(document.getElementById('fps').innerText)"
+
     def get_result_one(self, driver):
         return self.e.get_attribute('innerText')
@@ -1,3 +1,6 @@
+import base64
+import gzip
+import math
 import os
 import platform
 import re
@@ -28,6 +31,10 @@ sys.path.append(script_dir)
 sys.path.append(script_dir + '/..')
 
 from util.base import * # pylint: disable=unused-wildcard-import
+from benchmark.devtools import *
+from benchmark.load import *
+from benchmark.thermal import *
+from benchmark.dashboard import *
 
 category_info = {
     'comprehensive': 'Comprehensive',
@@ -41,6 +48,7 @@ category_info = {
     'fileop': 'FileOperation',
     'localstorage': 'LocalStorage',
     'render': 'PageRendering',
+    'startup': 'BrowserStartup',
 }
 
 metric_info = {
@@ -50,9 +58,112 @@ metric_info = {
     's': 's(-)'
 }
 
+# metrics of DevTools Performance domain sampled for each round
+memory_metrics = [
+    'JSHeapUsedSize', 'JSHeapTotalSize', 'Nodes', 'Documents', 'JSEventListeners',
+    'LayoutCount', 'LayoutDuration', 'RecalcStyleCount', 'RecalcStyleDuration',
+]
+
+# harness scripts bundled with webmark, which are injected inline
+JS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/js'
+
+# arguments: count, interval in ms, callback
+SAMPLE_SCRIPT = '''
+    var count = arguments[0];
+    var callback = arguments[arguments.length - 1];
+    var samples = [];
+    var timer = setInterval(function() {
+      samples.push(%s);
+      if (samples.length >= count) {
+        clearInterval(timer);
+        callback(samples);
+      }
+    }, arguments[1]);
+'''
+
+# arguments: timeout in ms, arguments of script, callback
+WAIT_SCRIPT = '''
+    var timeout = arguments[0];
+    var args = arguments[1];
+    var callback = arguments[arguments.length - 1];
+    var start = Date.now();
+    var check = function() {
+      if ((function() {%s}).apply(null, args)) {
+        callback(true);
+      } else if (Date.now() - start > timeout) {
+        callback(false);
+      } else {
+        setTimeout(check, 50);
+      }
+    };
+    check();
+'''
+
+# return: count of overwritten frames, frame intervals since last read
+FRAME_FETCH_SCRIPT = '''
+    var frame = window.webmarkFrame;
+    if (!frame) {
+      return [0, []];
+    }
+    var start = Math.max(frame.read, frame.count - frame.times.length);
+    var lost = start - frame.read;
+    var times = [];
+    for (var i = start; i < frame.count; i++) {
+      times.push(frame.times[i % frame.times.length]);
+    }
+    frame.read = frame.count;
+    return [lost, times];
+'''
+
+# return: load phases of current document in ms since navigation start, and bytes transferred by document and resources
+LOAD_SCRIPT = '''
+    var load = {};
+    var navigation = performance.getEntriesByType('navigation')[0];
+    if (navigation) {
+      load.ttfb = navigation.responseStart - navigation.startTime;
+      load.domInteractive = navigation.domInteractive;
+      load.domContentLoaded = navigation.domContentLoadedEventEnd;
+      load.load = navigation.loadEventEnd;
+      load.transferSize = navigation.transferSize || 0;
+    } else {
+      var timing = performance.timing;
+      load.ttfb = timing.responseStart - timing.navigationStart;
+      load.domInteractive = timing.domInteractive - timing.navigationStart;
+      load.domContentLoaded = timing.domContentLoadedEventEnd - timing.navigationStart;
+      load.load = timing.loadEventEnd - timing.navigationStart;
+      load.transferSize = 0;
+    }
+    performance.getEntriesByType('paint').forEach(function(entry) {
+      load[entry.name == 'first-paint' ? 'firstPaint' : 'firstContentfulPaint'] = entry.startTime;
+    });
+    var resources = performance.getEntriesByType('resource');
+    load.resources = resources.length;
+    resources.forEach(function(entry) {
+      load.transferSize += entry.transferSize || 0;
+    });
+    for (var key in load) {
+      load[key] = Math.round(load[key] * 10) / 10;
+    }
+    return load;
+'''
+
 class Benchmark(object):
     def __init__(self, driver, case):
         self.driver = driver
+        self.extra = {}
+        # prefix of files saved along with result, which is set by webmark
+        self.result_prefix = '%s/%s' % (ScriptRepo.IGNORE_WEBMARK_RESULT_DIR, Util.get_datetime())
+        # browser flags of the run, which is set by webmark in flag sweep
+        self.flags = []
+        # DevTools connection to page, which is shared by transport, memory metrics and emulation
+        self.page_devtools = None
+        self.memory_fallback = False
+        self.load = None
+        # window handle of the measured page, and background ones opened for multi-tab variants
+        self.main_window = None
+        self.tab_windows = []
+        # statistics of a variant beyond its result, which is set by benchmark overriding _run_rounds
+        self.summary = {}
 
         # handle states
         funcs = [func for func in dir(self) if callable(getattr(self, func))]
@@ -86,6 +197,32 @@ class Benchmark(object):
             'orientation': 'landscape',
             'device_id': 'NA',
             'target_os': 'NA',
+            'sample_interval': 0.5,
+            'sample_batch': 6,
+            'sample_min': 12,
+            'sample_tolerance': 0.01,
+            'sample_window': 30,
+            'frame_time': True,
+            'frame_refresh': 60,
+            'frame_long': 50,
+            'subtests': [],
+            'window_sizes': [],
+            'device_scale_factors': [],
+            'load_levels': [],
+            'load_cores': 0,
+            'load_memory': 0,
+            'load_disk': 0,
+            'tabs': [],
+            'tab_paths': [],
+            'tab_mode': 'tab',
+            'cooldown': False,
+            'cooldown_timeout': 120,
+            'transport': 'webdriver',
+            'cache': '',
+            'load_timing': True,
+            'memory': True,
+            'trace': False,
+            'trace_categories': '-*,toplevel,blink,cc,gpu,v8,viz,devtools.timeline,disabled-by-default-devtools.timeline,disabled-by-default-devtools.timeline.frame',
         }
         for key in members:
             if key == 'name':
@@ -102,6 +239,23 @@ class Benchmark(object):
             else:
                 self.__dict__[key] = members[key]
 
+        # handle subtests. Benchmark supporting subset run defines subtests_all in CONFIG, and empty list means any name.
+        if self.subtests:
+            if not 'subtests_all' in config:
+                Util.error('%s does not support subtests' % self.name)
+            for subtest in self.subtests:
+                if config['subtests_all'] and subtest not in config['subtests_all']:
+                    Util.error('subtest %s is not supported by %s' % (subtest, self.name))
+
+        if self.tab_mode not in ['tab', 'window']:
+            Util.error('tab_mode %s is not supported' % self.tab_mode)
+        if self.cache not in ['', 'cold', 'warm']:
+            Util.error('cache %s is not supported' % self.cache)
+        # load sensitivity is relative to the variant without load
+        if self.load_levels and 0 not in self.load_levels:
+            Util.warning('load_levels of %s do not have 0, so it is added as the baseline of load sensitivity' % self.name)
+            self.load_levels = [0] + list(self.load_levels)
+
         # handle path
         key = 'path'
         if hasattr(case, key):
@@ -128,45 +282,236 @@ class Benchmark(object):
     def get_result_one(self, driver):
         return '0.0'
 
-    def get_result_periodic(self, driver, count=5, period=3):
-        result = 0.0
-        for i in range(1, count + 1):
-            time.sleep(period)
-            result_one = float(self.get_result_one(driver))
-            if self.CONFIG["metric"] == metric_info['fps'] and result_one > 60:
-                result_one = 60
-            Util.info('Periodic result: %s' % result_one)
-            result += (result_one - result) / i
+    # Javascript expression to get the result in page, which allows to sample it in batch
+    def get_result_script(self):
+        return ''
+
+    # Sample the result in batches until its standard error is within sample_tolerance of the mean, or sample_window expires
+    def get_result_periodic(self, driver):
+        script = self.get_result_script()
+        samples = []
+        if self.frame_time:
+            self.inject_frame_time(driver)
+        time_start = time.time()
+        while True:
+            if script:
+                batch = self.execute_async_script(driver, SAMPLE_SCRIPT % script, self.sample_batch * self.sample_interval + 10, self.sample_batch, int(self.sample_interval * 1000))
+            else:
+                batch = []
+                for i in range(self.sample_batch):
+                    time.sleep(self.sample_interval)
+                    batch.append(self.get_result_one(driver))
+            if self.frame_time:
+                self.get_frame_time(driver)
+
+            batch = [float(x) for x in batch]
+            if self.metric == metric_info['fps']:
+                batch = [min(x, 60) for x in batch]
+            samples += batch
+
+            count = len(samples)
+            mean, stdev = self.get_mean_stdev(samples)
+            dashboard.publish('sample', {'name': self.name, 'samples': batch, 'mean': round(mean, 2), 'stdev': round(stdev, 2), 'count': count})
+            Util.info('Periodic result: %s +/- %s (%s samples)' % (round(mean, 2), round(stdev, 2), count))
+            if count >= self.sample_min and mean and stdev / math.sqrt(count) <= self.sample_tolerance * mean:
+                break
+            if time.time() - time_start >= self.sample_window:
+                Util.warning('Periodic result does not converge within %ss' % self.sample_window)
+                break
+
+        self.extra['sample'] = {'mean': round(mean, 2), 'stdev': round(stdev, 2), 'count': count}
+        if self.frame_time:
+            self.extra['frame'] = self.get_frame_stat()
+            Util.info('Frame result: %s' % self.extra['frame'])
+        return [str(round(mean, 2))]
+
+    def inject_frame_time(self, driver):
+        self.frame_times = []
+        self.frame_lost = 0
+        self.inject_js(driver, 'frame.js')
+
+    def get_frame_time(self, driver):
+        lost, times = self.execute_script(driver, FRAME_FETCH_SCRIPT)
+        self.frame_lost += lost
+        self.frame_times += times
+
+    # frame time percentiles in ms, ratio of frames missing their vsync, and count of frames longer than frame_long ms
+    def get_frame_stat(self):
+        times = sorted(self.frame_times)
+        count = len(times)
+        if not count:
+            return {}
+
+        vsync = 1000.0 / self.frame_refresh
+        dropped = 0
+        for t in times:
+            dropped += max(0, int(round(t / vsync)) - 1)
+
+        return {
+            'p50': round(self.get_percentile(times, 50), 2),
+            'p95': round(self.get_percentile(times, 95), 2),
+            'p99': round(self.get_percentile(times, 99), 2),
+            'dropped': round(float(dropped) / (count + dropped), 4),
+            'long': len([t for t in times if t > self.frame_long]),
+            'count': count,
+            'lost': self.frame_lost,
+        }
+
+    @staticmethod
+    def get_mean_stdev(samples):
+        count = len(samples)
+        if not count:
+            return 0.0, 0.0
+        mean = sum(samples) / float(count)
+        if count == 1:
+            return mean, 0.0
+        stdev = math.sqrt(sum((x - mean) ** 2 for x in samples) / (count - 1))
+        return mean, stdev
 
-        return [str(round(result, 2))]
+    # nearest-rank percentile of sorted samples
+    @staticmethod
+    def get_percentile(samples, percent):
+        if not samples:
+            return 0.0
+        index = int(math.ceil(percent / 100.0 * len(samples))) - 1
+        return samples[max(0, min(index, len(samples) - 1))]
 
     # Each specific benchmark only returns result in string format, we will convert them to float here.
     def run(self):
             Util.info('Begin to run "%s" version "%s"' % (self.name, self.version))
+            dashboard.publish('case', {'name': self.name, 'version': self.version})
+            driver = self.driver
+
+            cooldown_case = {}
+            if self.cooldown and not self.dryrun:
+                waited, state = cooldown.wait(self.cooldown_timeout)
+                cooldown_case = {'waited': waited, 'state': state}
+
+            self.setup(driver)
+            if self.trace and not self.dryrun:
+                self.start_trace(driver)
+            variants = []
+            lines = []
+            for variant in self.get_variants():
+                self.summary = {}
+                if variant:
+                    Util.info('Begin to run variant %s' % self.get_variant_label(variant))
+                    if not self.dryrun:
+                        self.set_variant(driver, variant)
+                results_final, rounds = self._run_rounds(driver)
+                record_variant = {'variant': variant, 'result': results_final, 'rounds': rounds}
+                if self.summary:
+                    record_variant['summary'] = self.summary
+                if 'tabs' in variant:
+                    aggregates = [x['extra']['tabs']['aggregate'] for x in rounds if 'tabs' in x['extra']]
+                    if aggregates:
+                        record_variant['aggregate'] = round(sum(aggregates) / len(aggregates), 2)
+                        Util.info('Aggregate result of %s tabs: %s' % (variant['tabs'], record_variant['aggregate']))
+                if variant and not self.dryrun and driver:
+                    record_variant['pixels'] = self.get_pixels(driver)
+                    Util.info('Variant result: %s pixels, %s' % (record_variant['pixels'], ','.join(str(x) for x in results_final)))
+                variants.append(record_variant)
+
+                outputs = []
+                for item in ['category', 'name', 'version', 'metric', 'result']:
+                    if item == 'category':
+                        outputs.append(self.category)
+                    elif item == 'name':
+                        outputs.append(self.__class__.__name__)
+                    elif item == 'version':
+                        version = self.version
+                        if self.subtests:
+                            version += ' partial:%s' % '|'.join(self.subtests)
+                        if self.flags:
+                            version += ' flags:%s' % '|'.join(self.flags)
+                        if variant:
+                            version += ' %s' % self.get_variant_label(variant)
+                        outputs.append(version)
+                    elif item == 'metric':
+                        outputs.append(self.metric)
+                    elif item == 'result':
+                        outputs.append(','.join(str(x) for x in results_final))
+                lines.append('Case result: ' + ','.join(outputs))
+                dashboard.publish('result', {'name': self.name, 'line': lines[-1]})
+            if not self.dryrun:
+                self.reset_variant(driver)
+            if self.load_levels:
+                self.get_load_sensitivity(variants)
+
+            if self.page_devtools:
+                self.page_devtools.close()
+                self.page_devtools = None
+            trace_file = ''
+            if self.trace and not self.dryrun:
+                trace_file = '%s-%s-%s.json.gz' % (self.result_prefix, self.__class__.__name__, Util.get_datetime())
+                self.stop_trace(trace_file)
+            self.teardown(driver)
+
+            self.record = {
+                'category': self.category,
+                'name': self.__class__.__name__,
+                'version': self.version,
+                'metric': self.metric,
+                'result': variants[0]['result'],
+                'rounds': variants[0]['rounds'],
+                'partial': bool(self.subtests),
+                'subtests': self.subtests,
+                'flags': self.flags,
+                'trace': trace_file,
+                'cooldown': cooldown_case,
+                'cache': self.cache or 'default',
+                'browser': self.get_browser_info(driver),
+            }
+            if variants[0]['variant']:
+                self.record['variants'] = variants
+            return '\n'.join(lines)
+
+    def _run_rounds(self, driver):
             times_run = self.times_run
             times_skip = self.times_skip
-            driver = self.driver
+            self.run_fail = False
 
             results = []
+            rounds = []
             for i in range(times_run):
                 self.result = []
+                self.extra = {}
                 self.state = 0
                 if not self.dryrun:
+                    # the first round is covered by the cooldown at case start
+                    if self.cooldown and i > 0:
+                        waited, state = cooldown.wait(self.cooldown_timeout)
+                        self.extra['cooldown'] = {'waited': waited, 'state': state}
+                    if self.cache:
+                        self.prepare_cache(driver)
                     print(self.path)
                     driver.get(self.path)
+                    if self.load_timing:
+                        self.extra['load'] = self.get_load(driver)
+                    if self.memory:
+                        self.start_memory(driver)
                     try:
                         WebDriverWait(driver, self.timeout, self.sleep).until(self._is_finished)
                     except Exception:
                         self.run_fail = True
+                    if self.memory:
+                        self.extra['memory'] = self.get_memory(driver)
                 if times_skip > 0:
                     times_skip = times_skip - 1
                     continue
                 result = self.get_result(driver)
                 Util.info('Round result: ' + ','.join([str(x) for x in result]))
+                if self.tab_windows:
+                    self.extra['tabs'] = self.get_tab_results(driver, result)
+                dashboard.publish('round', {'name': self.name, 'round': i, 'result': result, 'extra': self.extra})
                 results.append([float(x) for x in result])
+                rounds.append({'result': [float(x) for x in result], 'extra': self.extra})
                 if self.run_fail:
                     break
 
+            return self.get_stat(results), rounds
+
+    def get_stat(self, results):
             count_results = len(results)
             if count_results == 0:
                 Util.error('There is no result for ' + self.name)
@@ -176,16 +521,16 @@ class Benchmark(object):
             if self.stat == 'median':
                 count_results = len(results)
                 if count_results % 2:
-                    results_final = results[(count_results - 1) / 2]
+                    results_final = results[(count_results - 1) // 2]
                 else:
-                    results_total = results[(count_results - 1) / 2]
+                    results_total = list(results[(count_results - 1) // 2])
                     count_result = len(results[0])
                     for i in range(count_result):
-                        results_total[i] += results[(count_results - 1) / 2 + 1][i]
+                        results_total[i] += results[(count_results - 1) // 2 + 1][i]
                     for i in range(count_result):
                         results_final.append(round(results_total[i] / 2, 2))
             elif self.stat == 'average':
-                results_total = results[0]
+                results_total = list(results[0])
                 count_result = len(results[0])
                 for i in range(1, count_results):
                     for j in range(count_result):
@@ -199,40 +544,366 @@ class Benchmark(object):
                 else:
                     results_final = results[-1]
 
-            outputs = []
-            for item in ['category', 'name', 'version', 'metric', 'result']:
-                if item == 'category':
-                    outputs.append(self.category)
-                elif item == 'name':
-                    outputs.append(self.__class__.__name__)
-                elif item == 'version':
-                    outputs.append(self.version)
-                elif item == 'metric':
-                    outputs.append(self.metric)
-                elif item == 'result':
-                    outputs.append(','.join(str(x) for x in results_final))
-            return 'Case result: ' + ','.join(outputs)
+            return results_final
+
+    # Variants of one case run in the same session, such as window sizes, device pixel ratios and background load levels
+    def get_variants(self):
+        variants = [{}]
+        if self.window_sizes or self.device_scale_factors:
+            variants = []
+            for window_size in self.window_sizes or ['']:
+                for device_scale_factor in self.device_scale_factors or [0]:
+                    variants.append({'window_size': window_size, 'device_scale_factor': device_scale_factor})
+        if self.tabs:
+            variants_tabs = []
+            for variant in variants:
+                for count_tab in self.tabs:
+                    variant_tabs = dict(variant)
+                    variant_tabs['tabs'] = count_tab
+                    variants_tabs.append(variant_tabs)
+            variants = variants_tabs
+        if self.load_levels:
+            variants_load = []
+            for variant in variants:
+                for load_level in self.load_levels:
+                    variant_load = dict(variant)
+                    variant_load['load_level'] = load_level
+                    variants_load.append(variant_load)
+            variants = variants_load
+        return variants
+
+    def get_variant_label(self, variant):
+        labels = []
+        if 'window_size' in variant:
+            label = variant['window_size'] or 'default'
+            if variant['device_scale_factor']:
+                label += '@%sx' % variant['device_scale_factor']
+            labels.append(label)
+        if 'tabs' in variant:
+            labels.append('tabs:%s' % variant['tabs'])
+        if 'load_level' in variant:
+            labels.append('load:%s%%' % variant['load_level'])
+        return ' '.join(labels)
+
+    # Window size and device pixel ratio are emulated through DevTools, which lasts until the connection is closed
+    def set_variant(self, driver, variant):
+        if self.load:
+            self.load.stop()
+            self.load = None
+        if variant.get('load_level'):
+            self.load = BackgroundLoad(variant['load_level'], self.load_cores, self.load_memory, self.load_disk)
+            self.load.start()
+
+        if 'tabs' in variant:
+            self.set_tabs(driver, variant['tabs'])
+
+        if 'window_size' in variant:
+            width = 0
+            height = 0
+            if variant['window_size']:
+                width, height = [int(x) for x in variant['window_size'].split('x')]
+                driver.set_window_size(width, height)
+            self.get_page_devtools(driver).send('Emulation.setDeviceMetricsOverride', {
+                'width': width,
+                'height': height,
+                'deviceScaleFactor': variant['device_scale_factor'],
+                'mobile': False,
+            })
+
+    def reset_variant(self, driver):
+        if self.tabs:
+            self.set_tabs(driver, 1)
+        if self.load:
+            self.load.stop()
+            self.load = None
+        if self.window_sizes or self.device_scale_factors:
+            self.get_page_devtools(driver).send('Emulation.clearDeviceMetricsOverride')
+
+    # Keep count_tab pages open including the measured one. Background pages load tab_paths in turn, or the measured page
+    # if tab_paths is not given, and keep running while the measured page runs its rounds.
+    def set_tabs(self, driver, count_tab):
+        if not self.main_window:
+            self.main_window = driver.current_window_handle
+        for handle in self.tab_windows:
+            driver.switch_to.window(handle)
+            driver.close()
+        self.tab_windows = []
+        driver.switch_to.window(self.main_window)
+
+        paths = self.tab_paths or [self.path]
+        for i in range(count_tab - 1):
+            handles = driver.window_handles
+            if self.tab_mode == 'window':
+                driver.execute_script("window.open(arguments[0], '', 'width=' + screen.availWidth + ',height=' + screen.availHeight)", paths[i % len(paths)])
+            else:
+                driver.execute_script("window.open(arguments[0], '_blank')", paths[i % len(paths)])
+            WebDriverWait(driver, 30, 0.1).until(lambda driver: len(driver.window_handles) > len(handles))
+            self.tab_windows += [handle for handle in driver.window_handles if handle not in handles]
+            driver.switch_to.window(self.main_window)
+
+    # Result of each background page is read with get_result_script, so it's only available for pages of the same
+    # benchmark. Aggregate throughput adds them to the result of measured page.
+    def get_tab_results(self, driver, result):
+        script = self.get_result_script()
+        results = []
+        for handle in self.tab_windows:
+            result_tab = None
+            if script:
+                try:
+                    driver.switch_to.window(handle)
+                    result_tab = driver.execute_script('try { return %s; } catch (e) { return null; }' % script)
+                except Exception:
+                    pass
+            results.append(round(float(result_tab), 2) if result_tab is not None else None)
+        driver.switch_to.window(self.main_window)
+
+        results = [float(result[0])] + results
+        aggregate = sum([x for x in results if x is not None])
+        Util.info('Tab result: %s' % ','.join(str(x) for x in results))
+        return {'count': len(results), 'results': results, 'aggregate': round(aggregate, 2)}
+
+    # Relative change of the first result under each load level against the same variant without load
+    def get_load_sensitivity(self, variants):
+        for variant in variants:
+            if not variant['variant'].get('load_level'):
+                continue
+            for variant_base in variants:
+                base = dict(variant_base['variant'])
+                base['load_level'] = variant['variant']['load_level']
+                if variant_base['variant'].get('load_level') == 0 and base == variant['variant']:
+                    if variant_base['result'] and variant_base['result'][0]:
+                        variant['sensitivity'] = round((variant['result'][0] - variant_base['result'][0]) / variant_base['result'][0], 4)
+                        Util.info('Load sensitivity of %s: %s' % (self.get_variant_label(variant['variant']), variant['sensitivity']))
+                    break
+
+    # Cold cache clears HTTP cache (code cache is cleared along with it by browser), cache storage and service workers.
+    # Warm cache loads the page once and discards it.
+    def prepare_cache(self, driver):
+        if self.cache == 'cold':
+            driver.get('about:blank')
+            try:
+                devtools = self.get_page_devtools(driver)
+                devtools.send('Network.clearBrowserCache')
+                match = re.match(r'(https?://[^/]+)', self.path)
+                if match:
+                    devtools.send('Storage.clearDataForOrigin', {'origin': match.group(1), 'storageTypes': 'cache_storage,service_workers'})
+            except DevToolsError as e:
+                Util.error('Could not clear cache for cold run: %s' % e)
+        elif self.cache == 'warm':
+            driver.get(self.path)
+            self.wait_script(driver, "return document.readyState == 'complete'", self.timeout)
+
+    def get_browser_info(self, driver):
+        return {
+            'name': driver.capabilities.get('browserName', 'NA'),
+            'version': driver.capabilities.get('browserVersion', driver.capabilities.get('version', 'NA')),
+        }
+
+    # count of device pixels in viewport
+    def get_pixels(self, driver):
+        return self.execute_script(driver, 'return Math.round(window.innerWidth * window.innerHeight * Math.pow(window.devicePixelRatio, 2))')
+
+    # called before the first round and after the last round
+    def setup(self, driver):
+        pass
+
+    def teardown(self, driver):
+        pass
+
+    # Counters of Performance domain are per page, so it's enabled after each navigation
+    def start_memory(self, driver):
+        if self.memory_fallback:
+            return
+        try:
+            self.get_page_devtools(driver).send('Performance.enable')
+        except Exception as e:
+            self.memory_fallback = True
+            Util.warning('Could not get memory metrics from DevTools, will use performance.memory instead: %s' % e)
+
+    # Sample JS heap, DOM and layout work of renderer. Sizes are in bytes and durations are in seconds.
+    # The connection is dropped if renderer crashes, and then no memory is recorded for the round rather than failing
+    # the case.
+    def get_memory(self, driver):
+        memory = {}
+        if not self.memory_fallback:
+            try:
+                metrics = self.get_page_devtools(driver).send('Performance.getMetrics')['metrics']
+            except (DevToolsError, OSError) as e:
+                Util.warning('Could not get memory metrics from DevTools: %s' % e)
+                if self.page_devtools:
+                    self.page_devtools.close()
+                    self.page_devtools = None
+                return memory
+            for metric in metrics:
+                if metric['name'] in memory_metrics:
+                    memory[metric['name']] = metric['value']
+        else:
+            try:
+                memory = self.execute_script(driver, '''
+    var memory = {Nodes: document.getElementsByTagName('*').length};
+    if (performance.memory) {
+      memory.JSHeapUsedSize = performance.memory.usedJSHeapSize;
+      memory.JSHeapTotalSize = performance.memory.totalJSHeapSize;
+    }
+    return memory;
+                ''')
+            except Exception as e:
+                Util.warning('Could not get memory metrics from performance.memory: %s' % e)
+                return memory
+        Util.info('Memory result: %s' % memory)
+        return memory
+
+    # Navigation, paint and resource timing are collected in one script call right after the page is loaded. Paint
+    # entries are missing if the page has not painted yet.
+    def get_load(self, driver):
+        try:
+            load = self.execute_script(driver, LOAD_SCRIPT)
+        except Exception as e:
+            Util.warning('Could not get load timing: %s' % e)
+            return {}
+        Util.info('Load result: %s' % load)
+        return load
+
+    def start_trace(self, driver):
+        Util.info('Begin to trace with categories %s' % self.trace_categories)
+        trace_config = {
+            'includedCategories': [x for x in self.trace_categories.split(',') if not x.startswith('-')],
+            'excludedCategories': [x[1:] for x in self.trace_categories.split(',') if x.startswith('-')],
+        }
+        try:
+            self.trace_devtools = DevTools.connect_browser(driver)
+            self.trace_devtools.send('Tracing.start', {'traceConfig': trace_config, 'transferMode': 'ReturnAsStream', 'streamCompression': 'gzip'})
+        except DevToolsError as e:
+            Util.error('Could not start trace: %s' % e)
+
+    # read the trace stream chunk by chunk into trace_file, which is always gzip compressed
+    def stop_trace(self, trace_file):
+        devtools = self.trace_devtools
+        try:
+            devtools.send('Tracing.end')
+            params = devtools.wait_event('Tracing.tracingComplete', self.timeout)['params']
+            stream = params['stream']
+            if params.get('streamCompression') == 'gzip':
+                f = open(trace_file, 'wb')
+            else:
+                f = gzip.open(trace_file, 'wb')
+            while True:
+                chunk = devtools.send('IO.read', {'handle': stream, 'size': 1 << 20})
+                if chunk.get('base64Encoded'):
+                    f.write(base64.b64decode(chunk['data']))
+                else:
+                    f.write(chunk['data'].encode('utf-8'))
+                if chunk.get('eof'):
+                    break
+            f.close()
+            devtools.send('IO.close', {'handle': stream})
+        except DevToolsError as e:
+            Util.error('Could not save trace to %s: %s' % (trace_file, e))
+        devtools.close()
+        Util.info('Trace is saved to %s' % trace_file)
 
+    # jperf.js of webbench is executed inline once it's vendored into JS_DIR, and is served by webbench server otherwise,
+    # so that no run depends on GitHub
     def inject_jperf(self, driver):
-        if self.path_type == 'internal':
-            js = '%s/jperf/jperf.js' % Util.INTERNAL_WEBSERVER_WEBBENCH
+        if os.path.isfile('%s/jperf.js' % JS_DIR):
+            self.inject_js(driver, 'jperf.js')
         else:
-            js = 'https://raw.githubusercontent.com/gyagp/webbench/master/jperf/jperf.js'
-        self.inject_js(driver, js)
+            self.inject_js(driver, '%s/jperf/jperf.js' % Util.INTERNAL_WEBSERVER_WEBBENCH)
 
+    # js is either a script bundled in JS_DIR, which is executed inline, or a url to load and wait for
     def inject_js(self, driver, js):
+        if os.path.isfile('%s/%s' % (JS_DIR, js)):
+            f = open('%s/%s' % (JS_DIR, js))
+            script = f.read()
+            f.close()
+            self.execute_script(driver, script)
+            return
+
         script = '''
+    window.webmarkScripts = window.webmarkScripts || {};
+    var src = arguments[0];
     var script = document.createElement('script');
     script.type = 'text/javascript';
-    script.src = '%s';
+    script.src = src;
+    script.onload = function() {
+      window.webmarkScripts[src] = true;
+    };
     document.head.appendChild(script);
-        ''' % js
-        driver.execute_script('{' + script + '}')
-        time.sleep(3)
+        '''
+        self.execute_script(driver, script, js)
+        self.wait_script(driver, 'return window.webmarkScripts[arguments[0]] === true', 30, js)
+
+    def get_page_devtools(self, driver):
+        if not self.page_devtools:
+            self.page_devtools = DevTools.connect_page(driver)
+        return self.page_devtools
+
+    # Scripts run with the semantics of WebDriver execute_script. With transport devtools, they are evaluated directly
+    # through DevTools websocket instead of the WebDriver HTTP hop, while navigation and elements still use WebDriver.
+    def execute_script(self, driver, script, *args):
+        if self.transport == 'devtools':
+            expression = '(function() {%s}).apply(null, %s)' % (script, json.dumps(list(args)))
+            return self._evaluate(driver, expression, False, 60)
+        return driver.execute_script(script, *args)
+
+    # callback is passed as the last argument
+    def execute_async_script(self, driver, script, timeout, *args):
+        if self.transport == 'devtools':
+            expression = 'new Promise(function(resolve) { (function() {%s}).apply(null, %s.concat([resolve])); })' % (script, json.dumps(list(args)))
+            return self._evaluate(driver, expression, True, timeout)
+        driver.set_script_timeout(timeout)
+        return driver.execute_async_script(script, *args)
+
+    # wait until script returns true
+    def wait_script(self, driver, script, timeout, *args):
+        if self.transport == 'devtools':
+            if not self.execute_async_script(driver, WAIT_SCRIPT % script, timeout + 10, timeout * 1000, list(args)):
+                raise Exception('Timeout to wait for script: %s' % script)
+        else:
+            WebDriverWait(driver, timeout, 0.1).until(lambda driver: driver.execute_script(script, *args))
+
+    def _evaluate(self, driver, expression, await_promise, timeout):
+        result = self.get_page_devtools(driver).send('Runtime.evaluate', {'expression': expression, 'returnByValue': True, 'awaitPromise': await_promise}, timeout)
+        if 'exceptionDetails' in result:
+            details = result['exceptionDetails']
+            raise Exception('Script error: %s' % details.get('exception', {}).get('description', details.get('text')))
+        return result['result'].get('value')
+
+    # Parse the console of SunSpider and Kraken, which has means and 95% confidence intervals like:
+    # Total:                 123.4ms +/- 1.2%
+    #   crypto:               20.1ms +/- 2.3%
+    #     aes:                 7.0ms +/- 4.1%
+    # Return total and sub-scores keyed by category and category-test, such as crypto and crypto-aes.
+    def get_console_result(self, text):
+        pattern = re.compile(r'^(\s*)([\w.-]+):\s+(\d+\.?\d*)\s*ms\s+(?:\+/-|\u00b1)\s+(\d+\.?\d*)%')
+        total = ''
+        lines = []
+        for line in text.split('\n'):
+            match = pattern.match(line)
+            if not match:
+                continue
+            if match.group(2) == 'Total':
+                total = match.group(3)
+            else:
+                lines.append(match.groups())
+
+        subs = {}
+        if lines:
+            indent_category = min([len(x[0]) for x in lines])
+        category = ''
+        for indent, name, mean, interval in lines:
+            if len(indent) == indent_category:
+                category = name
+                key = name
+            else:
+                key = '%s-%s' % (category, name)
+            subs[key] = {'mean': float(mean), 'interval': float(interval)}
+        return total, subs
 
     def _is_finished(self, driver):
         if self.states[self.state][0](driver):
             act = self.states[self.state][1]
+            dashboard.publish('state', {'name': self.name, 'state': self.state})
             if act:
                 act(driver)
             self.state += 1
@@ -243,24 +914,10 @@ class Benchmark(object):
 class CssBenchmark(Benchmark):
     def inject_css_fps(self, driver):
         self.inject_jperf(driver)
-        script = '''
-    var cssFpsElement = document.createElement('div');
-    var style = 'float:left; width:800px; height:30px: color:red;';
-    cssFpsElement.setAttribute('style', style);
-    cssFpsElement.setAttribute('id', 'css-fps');
-    cssFpsElement.innerHTML = 'Recent FPS: 0, Average FPS: 0';
-    document.body.appendChild(cssFpsElement);
-
-    var cssFpsMeter = new window.jPerf.CSSFPSMeter();
-    cssFpsMeter.start();
-    document.addEventListener('CSSFPSReport',
-      function(event) {
-        cssFpsElement.innerHTML = 'Recent FPS: ' + event.recentFPS + ', Average FPS: ' + event.averageFPS;
-      },
-      false
-    );
-        '''
-        driver.execute_script(script)
+        self.inject_js(driver, 'cssfps.js')
+
+    def get_result_script(self):
+        return "parseFloat(/Average FPS: (.*)/.exec(document.getElementById('css-fps').innerText)[1])"
 
     def get_css_fps(self, driver):
         match = re.search('Average FPS: (.*)', driver.find_element_by_id('css-fps').get_attribute('innerText'))
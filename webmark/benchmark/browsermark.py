@@ -17,27 +17,33 @@ class browsermark(Benchmark):
             }
         },
         'timeout': 1800,
-        'test_all': [
+        'subtests_all': [
             '2D Rendering', '3D Rendering', 'Crunch', 'Resize',
             'Advance Search', 'Create Source', 'Dynamic Create', 'Search',
             'Graphics Canvas', 'Graphics SVG', 'Graphics WebGL',
             'Array Blur', 'Array Weighted', 'String Chat',
             'CSS', 'DOM', 'Graphics', 'Javascript',
         ],
-        'test': 'all',
     }
 
     def __init__(self, driver, case):
         super(browsermark, self).__init__(driver, case)
 
-        if hasattr(case, 'test'):
+        # test is the former option to run one subtest
+        if hasattr(case, 'test') and getattr(case, 'test') != 'all':
             test = getattr(case, 'test')
-            if test not in self.CONFIG['test_all']:
+            if test not in self.CONFIG['subtests_all']:
                 error('test is not supported')
+            self.subtests = [test]
 
-            self.test = getattr(case, 'test')
+        if self.subtests:
+            if len(self.subtests) > 1:
+                error('BrowserMark can only run one subtest at a time')
+            if self.path_type != 'internal':
+                error('subtests are only supported with internal path')
+            self.test = self.subtests[0]
         else:
-            self.test = self.CONFIG['test']
+            self.test = 'all'
 
         if self.version == '2.0' and self.path_type == 'external':
             if not case.username or not case.password:
@@ -24,5 +24,8 @@ class cubemap(Benchmark):
     def act0(self, driver):
         self.result = self.get_result_periodic(driver)
 
+    def get_result_script(self):
+        return "parseFloat(document.getElementById('fps').innerText)"
+
     def get_result_one(self, driver):
         return self.e.get_attribute('innerText')
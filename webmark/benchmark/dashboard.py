@@ -0,0 +1,90 @@
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Empty, Queue
+
+from util.base import * # pylint: disable=unused-wildcard-import
+
+DASHBOARD_PAGE = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/dashboard.html'
+
+# Stream events of the run to browsers as server-sent events. publish() does nothing until start() is called.
+class Dashboard(object):
+    # events kept for clients connecting in the middle of run
+    HISTORY_SIZE = 1000
+
+    def __init__(self):
+        self.server = None
+        self.history = []
+        self.clients = []
+        self.lock = threading.Lock()
+
+    def start(self, port):
+        dashboard = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/events':
+                    dashboard._serve_events(self)
+                elif self.path == '/':
+                    f = open(DASHBOARD_PAGE, 'rb')
+                    page = f.read()
+                    f.close()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/html; charset=utf-8')
+                    self.send_header('Content-Length', str(len(page)))
+                    self.end_headers()
+                    self.wfile.write(page)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('localhost', port), Handler)
+        self.server.daemon_threads = True
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        Util.info('Dashboard is at http://localhost:%s' % port)
+
+    def publish(self, type, data):
+        if not self.server:
+            return
+        event = json.dumps({'type': type, 'time': time.time(), 'data': data})
+        with self.lock:
+            self.history.append(event)
+            if len(self.history) > self.HISTORY_SIZE:
+                self.history = self.history[-self.HISTORY_SIZE:]
+            for client in self.clients:
+                client.put(event)
+
+    def _serve_events(self, handler):
+        client = Queue()
+        with self.lock:
+            events = list(self.history)
+            self.clients.append(client)
+        try:
+            handler.send_response(200)
+            handler.send_header('Content-Type', 'text/event-stream')
+            handler.send_header('Cache-Control', 'no-cache')
+            handler.end_headers()
+            for event in events:
+                handler.wfile.write(('data: %s\n\n' % event).encode('utf-8'))
+            handler.wfile.flush()
+            while True:
+                try:
+                    event = client.get(timeout=15)
+                    handler.wfile.write(('data: %s\n\n' % event).encode('utf-8'))
+                except Empty:
+                    # keep the connection alive
+                    handler.wfile.write(b': ping\n\n')
+                handler.wfile.flush()
+        except Exception:
+            pass
+        finally:
+            with self.lock:
+                self.clients.remove(client)
+
+dashboard = Dashboard()
@@ -0,0 +1,202 @@
+import base64
+import os
+import re
+import socket
+import struct
+import time
+from urllib.request import urlopen
+
+from util.base import * # pylint: disable=unused-wildcard-import
+
+class DevToolsError(Exception):
+    pass
+
+# A minimal client of Chrome DevTools protocol over websocket, which only handles plain ws:// connections to local browser.
+# Failures raise DevToolsError, so that callers can fall back or give up as they see fit.
+class DevTools(object):
+    OPCODE_CONTINUATION = 0x0
+    OPCODE_TEXT = 0x1
+    OPCODE_CLOSE = 0x8
+    OPCODE_PING = 0x9
+    OPCODE_PONG = 0xA
+
+    def __init__(self, ws_url, timeout=60):
+        match = re.match(r'ws://([^/:]+):(\d+)(/.*)', ws_url)
+        if not match:
+            raise DevToolsError('%s is not a valid DevTools url' % ws_url)
+        host, port, path = match.group(1), int(match.group(2)), match.group(3)
+
+        self.timeout = timeout
+        try:
+            self.sock = socket.create_connection((host, port), timeout)
+        except OSError as e:
+            raise DevToolsError('Could not connect to DevTools at %s: %s' % (ws_url, e))
+        self.buffer = b''
+        self.id = 0
+        self.events = []
+
+        key = base64.b64encode(os.urandom(16)).decode('utf-8')
+        request = 'GET %s HTTP/1.1\r\nHost: %s:%s\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: %s\r\nSec-WebSocket-Version: 13\r\n\r\n' % (path, host, port, key)
+        try:
+            self._sendall(request.encode('utf-8'))
+            response = self._recv_until(b'\r\n\r\n').decode('utf-8')
+        except DevToolsError:
+            self.sock.close()
+            raise
+        if not re.match(r'HTTP/1.1 101', response):
+            self.sock.close()
+            raise DevToolsError('Could not connect to DevTools: %s' % response.split('\r\n')[0])
+
+    @staticmethod
+    def get_address(driver):
+        for key in ['goog:chromeOptions', 'ms:edgeOptions']:
+            if key in driver.capabilities and 'debuggerAddress' in driver.capabilities[key]:
+                return driver.capabilities[key]['debuggerAddress']
+        raise DevToolsError('DevTools is not available for %s' % driver.capabilities.get('browserName'))
+
+    # URLError of urlopen is an OSError
+    @staticmethod
+    def get_json(url):
+        try:
+            return json.loads(urlopen(url).read().decode('utf-8'))
+        except (OSError, ValueError) as e:
+            raise DevToolsError('Could not get %s: %s' % (url, e))
+
+    # connect to browser target, which has domains like Tracing and IO
+    @staticmethod
+    def connect_browser(driver):
+        info = DevTools.get_json('http://%s/json/version' % DevTools.get_address(driver))
+        return DevTools(info['webSocketDebuggerUrl'])
+
+    # connect to page target of current window
+    @staticmethod
+    def connect_page(driver):
+        targets = DevTools.get_json('http://%s/json/list' % DevTools.get_address(driver))
+        targets = [target for target in targets if target['type'] == 'page']
+        for target in targets:
+            # window handle is target id, or CDwindow-<target id> in old chromedriver
+            if target['id'] in driver.current_window_handle:
+                return DevTools(target['webSocketDebuggerUrl'])
+        if not targets:
+            raise DevToolsError('Could not find page target in DevTools')
+        return DevTools(targets[0]['webSocketDebuggerUrl'])
+
+    # timeout in seconds overrides the one of connection, for commands that take long, such as awaiting a promise
+    def send(self, method, params=None, timeout=None):
+        self.id += 1
+        message = {'id': self.id, 'method': method, 'params': params or {}}
+        self._send_frame(self.OPCODE_TEXT, json.dumps(message).encode('utf-8'))
+        if timeout:
+            self.sock.settimeout(timeout)
+        try:
+            while True:
+                message = self._recv_message()
+                if message.get('id') == self.id:
+                    if 'error' in message:
+                        raise DevToolsError('DevTools %s failed: %s' % (method, message['error'].get('message')))
+                    return message.get('result', {})
+                if 'method' in message:
+                    self.events.append(message)
+        finally:
+            if timeout:
+                self.sock.settimeout(self.timeout)
+
+    # timeout in seconds is for the event to arrive, which defaults to the one of connection
+    def wait_event(self, method, timeout=None):
+        deadline = time.time() + (timeout or self.timeout)
+        try:
+            while True:
+                for index, event in enumerate(self.events):
+                    if event['method'] == method:
+                        return self.events.pop(index)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise DevToolsError('Timeout to wait for DevTools event %s' % method)
+                self.sock.settimeout(remaining)
+                try:
+                    message = self._recv_message()
+                except DevToolsError:
+                    if time.time() >= deadline:
+                        raise DevToolsError('Timeout to wait for DevTools event %s' % method)
+                    raise
+                if 'method' in message:
+                    self.events.append(message)
+        finally:
+            self.sock.settimeout(self.timeout)
+
+    def close(self):
+        try:
+            self._send_frame(self.OPCODE_CLOSE, b'')
+            self.sock.close()
+        except Exception:
+            pass
+
+    def _send_frame(self, opcode, payload):
+        header = struct.pack('!B', 0x80 | opcode)
+        length = len(payload)
+        # client frames are always masked
+        if length < 126:
+            header += struct.pack('!B', 0x80 | length)
+        elif length < 65536:
+            header += struct.pack('!BH', 0x80 | 126, length)
+        else:
+            header += struct.pack('!BQ', 0x80 | 127, length)
+        mask = os.urandom(4)
+        masked = bytearray(payload)
+        for i in range(length):
+            masked[i] ^= mask[i % 4]
+        self._sendall(header + mask + bytes(masked))
+
+    def _sendall(self, data):
+        try:
+            self.sock.sendall(data)
+        except OSError as e:
+            raise DevToolsError('Could not send to DevTools: %s' % e)
+
+    def _recv_message(self):
+        data = b''
+        while True:
+            head, length = struct.unpack('!BB', self._recv_exact(2))
+            opcode = head & 0x0F
+            if length & 0x80:
+                raise DevToolsError('DevTools server should not mask frames')
+            if length == 126:
+                length = struct.unpack('!H', self._recv_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', self._recv_exact(8))[0]
+            payload = self._recv_exact(length)
+
+            if opcode == self.OPCODE_PING:
+                self._send_frame(self.OPCODE_PONG, payload)
+                continue
+            if opcode == self.OPCODE_CLOSE:
+                raise DevToolsError('DevTools connection is closed')
+            if opcode in [self.OPCODE_TEXT, self.OPCODE_CONTINUATION]:
+                data += payload
+            if head & 0x80:
+                return json.loads(data.decode('utf-8'))
+
+    def _recv_exact(self, count):
+        while len(self.buffer) < count:
+            self._recv()
+        data = self.buffer[:count]
+        self.buffer = self.buffer[count:]
+        return data
+
+    def _recv_until(self, delimiter):
+        while delimiter not in self.buffer:
+            self._recv()
+        pos = self.buffer.index(delimiter) + len(delimiter)
+        data = self.buffer[:pos]
+        self.buffer = self.buffer[pos:]
+        return data
+
+    # socket.timeout is an OSError
+    def _recv(self):
+        try:
+            data = self.sock.recv(1 << 16)
+        except OSError as e:
+            raise DevToolsError('Could not receive from DevTools: %s' % e)
+        if not data:
+            raise DevToolsError('DevTools connection is lost')
+        self.buffer += data
@@ -0,0 +1,140 @@
+import json
+import math
+import platform
+import uuid
+
+from util.base import * # pylint: disable=unused-wildcard-import
+
+# unit and improvement direction of HistogramSet for metric of webmark
+histogram_units = {
+    'Score(+)': 'unitless_biggerIsBetter',
+    'FPS(+)': 'Hz_biggerIsBetter',
+    'ms(-)': 'ms_smallerIsBetter',
+    's(-)': 'ms_smallerIsBetter',
+}
+
+# Convert json records of webmark into HistogramSet json of perf dashboard. Histograms are written to file as soon as
+# a record is added, so records can be streamed from result store or from a running webmark.
+class HistogramExporter(object):
+    def __init__(self, histogram_file):
+        self.file = open(histogram_file, 'w')
+        self.file.write('[')
+        self.count = 0
+        self.host = {
+            'hostNames': [platform.node()],
+            'osNames': [platform.system()],
+            'osVersions': [platform.release()],
+            'architectures': [platform.machine()],
+        }
+
+    def add(self, record):
+        variants = record.get('variants') or [{'variant': {}, 'rounds': record['rounds']}]
+        for variant in variants:
+            diagnostics = dict(self.host)
+            diagnostics['benchmarks'] = ['webmark']
+            diagnostics['stories'] = [record['name']]
+            diagnostics['storyTags'] = ['%s:%s' % (key, value) for key, value in sorted(variant['variant'].items())]
+            if record.get('partial'):
+                diagnostics['storyTags'].append('partial:%s' % '|'.join(record['subtests']))
+            if record.get('flags'):
+                diagnostics['storyTags'].append('flags:%s' % '|'.join(record['flags']))
+            if record.get('browser'):
+                diagnostics['productVersions'] = [record['browser']['version']]
+            diagnostics['labels'] = [record['version']] + ([record['browser']['name']] if record.get('browser') else [])
+            guids = self._add_diagnostics(diagnostics)
+
+            rounds = variant['rounds']
+            unit = histogram_units.get(record['metric'], 'unitless')
+            scale = 1000 if record['metric'] == 's(-)' else 1
+            count_result = min([len(x['result']) for x in rounds]) if rounds else 0
+            for index in range(count_result):
+                name = record['name'] if index == 0 else '%s/%s' % (record['name'], index)
+                self._add_histogram(name, unit, [x['result'][index] * scale for x in rounds], guids)
+
+            # auxiliary metrics recorded in extra of each round
+            subs = {}
+            for round_one in rounds:
+                extra = round_one['extra']
+                for key, value in extra.get('subs', {}).items():
+                    subs.setdefault(('subs/%s' % key, 'ms_smallerIsBetter'), []).append(value['mean'])
+                for key, value in extra.get('memory', {}).items():
+                    if key.endswith('Size'):
+                        unit_memory = 'sizeInBytes_smallerIsBetter'
+                    elif key.endswith('Duration'):
+                        unit_memory = 'ms_smallerIsBetter'
+                        value *= 1000
+                    else:
+                        unit_memory = 'count_smallerIsBetter'
+                    subs.setdefault(('memory/%s' % key, unit_memory), []).append(value)
+                for key, value in extra.get('load', {}).items():
+                    if key == 'transferSize':
+                        unit_load = 'sizeInBytes_smallerIsBetter'
+                    elif key == 'resources':
+                        unit_load = 'count_smallerIsBetter'
+                    else:
+                        unit_load = 'ms_smallerIsBetter'
+                    subs.setdefault(('load/%s' % key, unit_load), []).append(value)
+                for key, value in extra.get('startup', {}).items():
+                    subs.setdefault(('startup/%s' % key, 'ms_smallerIsBetter'), []).append(value)
+                if 'tabs' in extra:
+                    subs.setdefault(('tabs/aggregate', unit), []).append(extra['tabs']['aggregate'])
+                for key in ['p50', 'p95', 'p99']:
+                    if key in extra.get('frame', {}):
+                        subs.setdefault(('frame/%s' % key, 'ms_smallerIsBetter'), []).append(extra['frame'][key])
+                if 'dropped' in extra.get('frame', {}):
+                    subs.setdefault(('frame/dropped', 'n%_smallerIsBetter'), []).append(extra['frame']['dropped'])
+            for (name, unit_sub), values in sorted(subs.items()):
+                self._add_histogram('%s/%s' % (record['name'], name), unit_sub, values, guids)
+
+    def close(self):
+        self.file.write(']\n')
+        self.file.close()
+
+    # diagnostics are shared by histograms of the same record variant
+    def _add_diagnostics(self, diagnostics):
+        guids = {}
+        for key, value in diagnostics.items():
+            if not value:
+                continue
+            guid = str(uuid.uuid4())
+            self._write({'type': 'GenericSet', 'guid': guid, 'values': value})
+            guids[key] = guid
+        return guids
+
+    def _add_histogram(self, name, unit, values, guids):
+        histogram = {'name': name, 'unit': unit, 'sampleValues': values, 'diagnostics': guids}
+        if values:
+            histogram['running'] = self._get_running(values)
+        self._write(histogram)
+
+    # running statistics in the order of dashboard: count, max, meanlogs, mean, min, sum, variance
+    @staticmethod
+    def _get_running(values):
+        count = len(values)
+        total = sum(values)
+        mean = total / count
+        # meanlogs is only defined when all the values are positive
+        if min(values) > 0:
+            meanlogs = sum([math.log(x) for x in values]) / count
+        else:
+            meanlogs = None
+        variance = sum([(x - mean) ** 2 for x in values]) / (count - 1) if count > 1 else 0
+        return [count, max(values), meanlogs, mean, min(values), total, variance]
+
+    def _write(self, item):
+        if self.count:
+            self.file.write(',\n')
+        self.file.write(json.dumps(item))
+        self.count += 1
+
+    # convert record file of webmark line by line
+    @staticmethod
+    def export(record_file, histogram_file):
+        exporter = HistogramExporter(histogram_file)
+        f = open(record_file)
+        for line in f:
+            if line.strip():
+                exporter.add(json.loads(line))
+        f.close()
+        exporter.close()
+        Util.info('Histograms of %s are exported to %s' % (record_file, histogram_file))
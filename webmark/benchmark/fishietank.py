@@ -56,6 +56,9 @@ class fishietank(Benchmark):
         time.sleep(5)
         self.result = self.get_result_periodic(driver)
 
+    def get_result_script(self):
+        return "parseFloat(/(\\d+\\.?\\d*) FPS/.exec(document.getElementById('fpsCanvas').title)[1])"
+
     def get_result_one(self, driver):
         pattern = re.compile('(\d+\.?\d*) FPS')
         match = pattern.search(driver.find_element_by_id('fpsCanvas').get_attribute('title'))
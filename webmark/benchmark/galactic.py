@@ -40,5 +40,8 @@ class galactic(Benchmark):
     def act0(self, driver):
         self.result = self.get_result_periodic(driver)
 
+    def get_result_script(self):
+        return 'gFpsData.AvgFps'
+
     def get_result_one(self, driver):
         return str(driver.execute_script('return gFpsData.AvgFps'))
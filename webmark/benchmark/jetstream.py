@@ -13,11 +13,45 @@ class jetstream(Benchmark):
             },
         'timeout': 1800,
         },
+        # names of JetStream plans, such as richards or crypto-aes
+        'subtests_all': [],
     }
 
     def __init__(self, driver, case):
         super(jetstream, self).__init__(driver, case)
 
+    # JetStream registers each plan through JetStream.addPlan() when loading, so wrap it before the page runs to only keep the selected plans
+    def setup(self, driver):
+        if not self.subtests:
+            return
+        script = '''
+    (function() {
+      var names = %s;
+      var jetStream;
+      Object.defineProperty(window, 'JetStream', {
+        configurable: true,
+        get: function() {
+          return jetStream;
+        },
+        set: function(value) {
+          var addPlan = value.addPlan;
+          value.addPlan = function(plan) {
+            if (names.indexOf(plan.name) != -1) {
+              return addPlan.apply(this, arguments);
+            }
+          };
+          jetStream = value;
+        }
+      });
+    })();
+        ''' % json.dumps(self.subtests)
+        self.script_id = driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': script})['identifier']
+
+    def teardown(self, driver):
+        if not self.subtests:
+            return
+        driver.execute_cdp_cmd('Page.removeScriptToEvaluateOnNewDocument', {'identifier': self.script_id})
+
     def cond0(self, driver):
         if driver.find_element_by_id('status'):
             return True
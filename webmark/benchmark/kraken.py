@@ -32,9 +32,6 @@ class kraken(Benchmark):
             return False
 
     def act1(self, driver):
-        txt = self.driver.find_element_by_id('console').text
-        pos = txt.find('Total:') + len('Total:')
-        txt = txt[pos:].strip()
-        pos = txt.find('ms')
-
-        self.result.append(txt[:pos])
+        total, subs = self.get_console_result(self.driver.find_element_by_id('console').text)
+        self.result.append(total)
+        self.extra['subs'] = subs
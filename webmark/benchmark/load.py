@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from util.base import * # pylint: disable=unused-wildcard-import
+
+# Workers are module functions so that they can be started by multiprocessing on Windows.
+def _cpu_worker(percent, stop):
+    period = 0.1
+    busy = period * percent / 100.0
+    while not stop.is_set():
+        start = time.time()
+        while time.time() - start < busy:
+            pass
+        if period > busy:
+            time.sleep(period - busy)
+
+def _memory_worker(size, stop):
+    src = bytearray(size << 20)
+    dst = bytearray(size << 20)
+    while not stop.is_set():
+        dst[:] = src
+
+def _disk_worker(size, stop):
+    block = os.urandom(1 << 20)
+    fd, path = tempfile.mkstemp(prefix='webmark-load-')
+    os.close(fd)
+    while not stop.is_set():
+        f = open(path, 'wb')
+        for i in range(size):
+            f.write(block)
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+    os.remove(path)
+
+# Synthetic background load: cpu percent on count of cores, plus optional memory copy and disk write in MB per cycle
+class BackgroundLoad(object):
+    def __init__(self, cpu_percent, cpu_cores=0, memory_size=0, disk_size=0):
+        self.cpu_percent = cpu_percent
+        if cpu_cores:
+            self.cpu_cores = cpu_cores
+        else:
+            self.cpu_cores = multiprocessing.cpu_count()
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.stop_event = None
+        self.processes = []
+
+    def start(self):
+        Util.info('Begin background load: cpu %s%% on %s cores, memory %sMB, disk %sMB' % (self.cpu_percent, self.cpu_cores, self.memory_size, self.disk_size))
+        self.stop_event = multiprocessing.Event()
+        workers = []
+        if self.cpu_percent:
+            for i in range(self.cpu_cores):
+                workers.append((_cpu_worker, (self.cpu_percent, self.stop_event)))
+        if self.memory_size:
+            workers.append((_memory_worker, (self.memory_size, self.stop_event)))
+        if self.disk_size:
+            workers.append((_disk_worker, (self.disk_size, self.stop_event)))
+        for target, args in workers:
+            process = multiprocessing.Process(target=target, args=args)
+            process.daemon = True
+            process.start()
+            self.processes.append(process)
+
+    def stop(self):
+        if not self.processes:
+            return
+        self.stop_event.set()
+        for process in self.processes:
+            process.join(10)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        Util.info('End background load')
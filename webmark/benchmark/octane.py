@@ -17,6 +17,10 @@ class octane(Benchmark):
             }
         },
         'timeout': 1200,
+        'subtests_all': [
+            'Richards', 'DeltaBlue', 'Crypto', 'RayTrace', 'EarleyBoyer', 'RegExp', 'Splay', 'NavierStokes',
+            'PdfJS', 'Mandreel', 'Gameboy', 'CodeLoad', 'Box2D', 'zlib', 'Typescript',
+        ],
     }
 
     def __init__(self, driver, case):
@@ -30,6 +34,14 @@ class octane(Benchmark):
             return False
 
     def act0(self, driver):
+        if self.subtests:
+            # only keep the selected suites, and the score is calculated from them
+            driver.execute_script('''
+    var names = arguments[0];
+    BenchmarkSuite.suites = BenchmarkSuite.suites.filter(function(suite) {
+      return names.indexOf(suite.name) != -1;
+    });
+            ''', self.subtests)
         self.e.click()
 
     def cond1(self, driver):
@@ -47,5 +59,9 @@ class octane(Benchmark):
 
         subs = driver.find_elements_by_class_name('p-result')
         for sub in subs:
-            result.append(sub.get_attribute('innerText'))
+            text = sub.get_attribute('innerText')
+            # suites not selected have no score
+            if self.subtests and not re.match('\d+', text):
+                continue
+            result.append(text)
         self.result = result
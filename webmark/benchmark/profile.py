@@ -0,0 +1,173 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from util.base import * # pylint: disable=unused-wildcard-import
+
+# Warmed user-data-dir built once per browser build, so that each case starts from a clone without first-run work.
+class ProfileTemplate(object):
+    ROOT_DIR = '%s/webmark-profile' % tempfile.gettempdir()
+
+    # browser finishes first-run work, such as component setup and cache creation, when its profile stops changing
+    WARM_TIMEOUT = 120
+    WARM_STABLE = 5
+    EXIT_TIMEOUT = 30
+    LOCKS = ['SingletonLock', 'SingletonSocket', 'SingletonCookie', 'lockfile']
+
+    def __init__(self, browser):
+        self.browser = browser
+        # browser build is identified by its binary, or by its name if path is not given
+        build = '%s|%s' % (browser.name, browser.path)
+        if browser.path and os.path.exists(browser.path):
+            stat = os.stat(browser.path)
+            build += '|%s|%s' % (stat.st_size, int(stat.st_mtime))
+        self.template_dir = '%s/%s' % (self.ROOT_DIR, hashlib.sha1(build.encode('utf-8')).hexdigest()[:16])
+
+    def ensure(self):
+        if os.path.exists(self.template_dir):
+            return
+
+        Util.info('Begin to build profile template %s' % self.template_dir)
+        tmp_dir = '%s.tmp' % self.template_dir
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        Util.ensure_dir(tmp_dir)
+        webdriver = self.browser.get_webdriver('--user-data-dir=%s' % tmp_dir)
+        webdriver.get('about:blank')
+        self._wait_written(tmp_dir)
+        try:
+            webdriver.quit()
+        except Exception:
+            pass
+        self._wait_exited(tmp_dir)
+        os.rename(tmp_dir, self.template_dir)
+
+    # wait until Local State is written and no file of profile changes for WARM_STABLE seconds
+    def _wait_written(self, profile_dir):
+        snapshot = None
+        time_stable = time.time()
+        time_end = time.time() + self.WARM_TIMEOUT
+        while time.time() < time_end:
+            time.sleep(1)
+            snapshot_new = self._get_snapshot(profile_dir)
+            if snapshot_new != snapshot:
+                snapshot = snapshot_new
+                time_stable = time.time()
+            elif os.path.exists('%s/Local State' % profile_dir) and time.time() - time_stable >= self.WARM_STABLE:
+                return
+        Util.warning('Profile %s is still changing after %s seconds' % (profile_dir, self.WARM_TIMEOUT))
+
+    @staticmethod
+    def _get_snapshot(profile_dir):
+        snapshot = {}
+        for root, _, files in os.walk(profile_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.lstat(path)
+                except OSError:
+                    continue
+                snapshot[path] = (stat.st_size, stat.st_mtime)
+        return snapshot
+
+    # Browser removes SingletonLock on exit, and lockfile on Windows can only be removed after browser exits. Lock
+    # files of a closed browser should not be cloned.
+    def _wait_exited(self, profile_dir):
+        time_end = time.time() + self.EXIT_TIMEOUT
+        while True:
+            locks = []
+            for lock in self.LOCKS:
+                path = '%s/%s' % (profile_dir, lock)
+                if not os.path.lexists(path):
+                    continue
+                if lock == 'SingletonLock' and time.time() < time_end:
+                    locks.append(lock)
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    locks.append(lock)
+            if not locks:
+                return
+            if time.time() >= time_end:
+                Util.error('Browser with profile %s does not exit in %s seconds' % (profile_dir, self.EXIT_TIMEOUT))
+            time.sleep(1)
+
+    # Clone template with copy-on-write (reflink on Linux, clonefile on macOS, block clone of ReFS on Windows) if
+    # filesystem supports it, otherwise copy. Hardlinks are not used, as browser modifies profile files in place and that
+    # would change template.
+    def clone(self):
+        self.ensure()
+        profile_dir = tempfile.mkdtemp(prefix='webmark-profile-')
+        os.rmdir(profile_dir)
+
+        if Util.HOST_OS == Util.WINDOWS:
+            try:
+                self._clone_windows(self.template_dir, profile_dir)
+                return profile_dir
+            except OSError:
+                pass
+        else:
+            if Util.HOST_OS == Util.LINUX:
+                cmd = ['cp', '-a', '--reflink=always', self.template_dir, profile_dir]
+            else:
+                cmd = ['cp', '-c', '-R', self.template_dir, profile_dir]
+            if subprocess.call(cmd, stderr=subprocess.DEVNULL) == 0:
+                return profile_dir
+
+        shutil.rmtree(profile_dir, ignore_errors=True)
+        shutil.copytree(self.template_dir, profile_dir, symlinks=True)
+        return profile_dir
+
+    # Clone each file with FSCTL_DUPLICATE_EXTENTS_TO_FILE, which is supported by ReFS. Cloned range must be aligned to
+    # cluster, and the last cluster may go beyond the end of file. OSError is raised if filesystem doesn't support it.
+    @staticmethod
+    def _clone_windows(src_dir, dst_dir):
+        import ctypes
+        import msvcrt
+        from ctypes import wintypes
+
+        class DuplicateExtentsData(ctypes.Structure):
+            _fields_ = [
+                ('FileHandle', wintypes.HANDLE),
+                ('SourceFileOffset', ctypes.c_longlong),
+                ('TargetFileOffset', ctypes.c_longlong),
+                ('ByteCount', ctypes.c_longlong),
+            ]
+
+        FSCTL_DUPLICATE_EXTENTS_TO_FILE = 0x98344
+        CHUNK_SIZE = 1 << 30
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        kernel32.DeviceIoControl.argtypes = [wintypes.HANDLE, wintypes.DWORD, ctypes.c_void_p, wintypes.DWORD, ctypes.c_void_p, wintypes.DWORD, ctypes.POINTER(wintypes.DWORD), ctypes.c_void_p]
+
+        sectors_per_cluster = wintypes.DWORD()
+        bytes_per_sector = wintypes.DWORD()
+        root = os.path.splitdrive(os.path.abspath(dst_dir))[0] + '\\'
+        if not kernel32.GetDiskFreeSpaceW(root, ctypes.byref(sectors_per_cluster), ctypes.byref(bytes_per_sector), None, None):
+            raise ctypes.WinError(ctypes.get_last_error())
+        cluster_size = sectors_per_cluster.value * bytes_per_sector.value
+
+        try:
+            for root_src, dirs, files in os.walk(src_dir):
+                root_dst = os.path.join(dst_dir, os.path.relpath(root_src, src_dir))
+                os.makedirs(root_dst, exist_ok=True)
+                for name in files:
+                    src = os.path.join(root_src, name)
+                    dst = os.path.join(root_dst, name)
+                    size = os.path.getsize(src)
+                    with open(src, 'rb') as f_src, open(dst, 'wb') as f_dst:
+                        f_dst.truncate(size)
+                        offset = 0
+                        while offset < size:
+                            count = min(CHUNK_SIZE, (size - offset + cluster_size - 1) // cluster_size * cluster_size)
+                            data = DuplicateExtentsData(msvcrt.get_osfhandle(f_src.fileno()), offset, offset, count)
+                            returned = wintypes.DWORD()
+                            if not kernel32.DeviceIoControl(msvcrt.get_osfhandle(f_dst.fileno()), FSCTL_DUPLICATE_EXTENTS_TO_FILE, ctypes.byref(data), ctypes.sizeof(data), None, 0, ctypes.byref(returned), None):
+                                raise ctypes.WinError(ctypes.get_last_error())
+                            offset += count
+                    shutil.copystat(src, dst)
+        except OSError:
+            shutil.rmtree(dst_dir, ignore_errors=True)
+            raise
@@ -0,0 +1,273 @@
+import ctypes
+import tempfile
+
+from benchmark.benchmark import *
+
+# phases of startup in ms since process spawn
+startup_phases = ['devtools', 'navigation', 'commit', 'firstPaint', 'firstContentfulPaint']
+
+# return: navigation start as epoch time in ms, and other phases in ms since navigation start
+STARTUP_SCRIPT = '''
+    new Promise(function(resolve) {
+      var check = function() {
+        var paints = {};
+        performance.getEntriesByType('paint').forEach(function(entry) {
+          paints[entry.name] = entry.startTime;
+        });
+        if (!('first-contentful-paint' in paints)) {
+          setTimeout(check, 10);
+          return;
+        }
+        var navigation = performance.getEntriesByType('navigation')[0];
+        resolve({
+          timeOrigin: performance.timeOrigin,
+          commit: navigation ? navigation.responseEnd : 0,
+          firstPaint: paints['first-paint'] || paints['first-contentful-paint'],
+          firstContentfulPaint: paints['first-contentful-paint'],
+        });
+      };
+      check();
+    })
+'''
+
+# Launch the browser of suite by itself rather than through webdriver, and measure from process spawn to first paint of a
+# simple page. Cold runs drop the page cache of OS before launch, and are skipped if it's not permitted. Warm runs launch
+# right after the previous one. Both reuse a profile created by a discarded launch, so that first-run work is not
+# measured. Suite closes its webdriver before this case, so that no other browser keeps the binaries in memory.
+class startup(Benchmark):
+    CONFIG = {
+        'category': category_info['startup'],
+        'name': 'Startup',
+        'version': '1.0',
+        'metric': metric_info['ms'],
+        'path_type': 'external',
+        'path': {
+            'external': '',
+        },
+        'times_run': 10,
+        'stat': 'median',
+        'memory': False,
+        'load_timing': False,
+        'webdriver': False,
+        'modes': ['cold', 'warm'],
+    }
+
+    def __init__(self, driver, case):
+        super(startup, self).__init__(driver, case)
+        self.modes = getattr(case, 'modes', self.CONFIG['modes'])
+        for mode in self.modes:
+            if mode not in ['cold', 'warm']:
+                Util.error('startup mode %s is not supported' % mode)
+        self.browser = getattr(case, 'browser', None)
+        if not self.dryrun and (not self.browser or not self.browser.path):
+            Util.error('Startup needs path of browser')
+        # these need webdriver or DevTools of a running browser
+        for key in ['tabs', 'window_sizes', 'device_scale_factors', 'trace']:
+            if getattr(self, key):
+                Util.error('Startup does not support %s' % key)
+        self.drop_permitted = True
+        self.variant_mode = ''
+        self.browser_version = 'NA'
+
+    def get_variants(self):
+        return [dict(variant, startup=mode) for variant in super(startup, self).get_variants() for mode in self.modes]
+
+    def get_variant_label(self, variant):
+        return ' '.join([x for x in [super(startup, self).get_variant_label(variant), variant['startup']] if x])
+
+    def setup(self, driver):
+        if 'cold' in self.modes and not self.dryrun and not self.drop_cache():
+            Util.warning('Skip cold startup, as page cache could not be dropped')
+            self.modes = [mode for mode in self.modes if mode != 'cold']
+            if not self.modes:
+                Util.error('Startup has no mode to run')
+        self.profile_dir = tempfile.mkdtemp(prefix='webmark-startup-')
+        if not self.path:
+            self.path = 'file:///%s/startup.html' % self.profile_dir.replace('\\', '/').lstrip('/')
+            f = open('%s/startup.html' % self.profile_dir, 'w')
+            f.write('<!DOCTYPE html><html><body><h1>Webmark</h1></body></html>')
+            f.close()
+        if not self.dryrun:
+            self.launch()
+
+    def teardown(self, driver):
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def get_browser_info(self, driver):
+        return {'name': self.browser.name if self.browser else 'NA', 'version': self.browser_version}
+
+    def _run_rounds(self, driver):
+        mode = self.variant_mode
+        self.run_fail = False
+        results = []
+        rounds = []
+        for i in range(self.times_run):
+            self.extra = {}
+            if self.dryrun:
+                phases = dict((phase, float(random.randint(100, 1000))) for phase in startup_phases)
+            else:
+                if mode == 'cold' and not self.drop_cache():
+                    self.run_fail = True
+                    phases = None
+                else:
+                    phases = self.launch()
+            if phases is None:
+                self.run_fail = True
+                Util.warning('Round %s of startup %s fails' % (i, mode))
+                results.append([0.0])
+                rounds.append({'result': [0.0], 'extra': self.extra})
+                break
+            if i < self.times_skip:
+                continue
+            self.extra['startup'] = phases
+            result = [phases['firstPaint']]
+            Util.info('Round result: %s, %s' % (result[0], phases))
+            dashboard.publish('round', {'name': self.name, 'round': i, 'result': result, 'extra': self.extra})
+            results.append(result)
+            rounds.append({'result': result, 'extra': self.extra})
+
+        for phase in startup_phases:
+            samples = sorted([x['extra']['startup'][phase] for x in rounds if 'startup' in x['extra']])
+            self.summary[phase] = dict(('p%s' % x, self.get_percentile(samples, x)) for x in [50, 90, 99])
+            Util.info('Startup %s %s: %s' % (mode, phase, self.summary[phase]))
+        return self.get_stat(results), rounds
+
+    def set_variant(self, driver, variant):
+        self.variant_mode = variant['startup']
+        super(startup, self).set_variant(driver, variant)
+
+    # Return phases in ms since spawn, or None if DevTools fails or browser does not exit. Browser writes the port of
+    # remote debugging to DevToolsActivePort in its profile once it's ready, and the page reports when it starts to
+    # navigate and paints.
+    def launch(self):
+        port_file = '%s/DevToolsActivePort' % self.profile_dir
+        if os.path.exists(port_file):
+            os.remove(port_file)
+        cmd = [self.browser.path, '--user-data-dir=%s' % self.profile_dir, '--remote-debugging-port=0', '--no-first-run', '--no-default-browser-check']
+        if self.browser.options:
+            cmd += self.browser.options.split()
+        cmd += self.flags
+        cmd.append(self.path)
+
+        time_spawn = time.time()
+        process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            while True:
+                if os.path.exists(port_file):
+                    lines = open(port_file).read().split('\n')
+                    if len(lines) > 1 and lines[1]:
+                        break
+                if time.time() - time_spawn > self.timeout:
+                    Util.error('Browser does not start within %ss' % self.timeout)
+                time.sleep(0.01)
+            time_devtools = time.time()
+            address = '127.0.0.1:%s' % lines[0].strip()
+
+            try:
+                while True:
+                    targets = DevTools.get_json('http://%s/json/list' % address)
+                    targets = [target for target in targets if target['type'] == 'page' and target['url'].startswith(self.path)]
+                    if targets:
+                        break
+                    if time.time() - time_spawn > self.timeout:
+                        Util.error('Browser does not open %s within %ss' % (self.path, self.timeout))
+                    time.sleep(0.01)
+                devtools = DevTools(targets[0]['webSocketDebuggerUrl'])
+                result = devtools.send('Runtime.evaluate', {'expression': STARTUP_SCRIPT, 'returnByValue': True, 'awaitPromise': True}, self.timeout)
+                devtools.close()
+                info = DevTools.get_json('http://%s/json/version' % address)
+            except DevToolsError as e:
+                Util.warning('Could not get startup timing: %s' % e)
+                return None
+            if 'exceptionDetails' in result:
+                Util.error('Could not get startup timing: %s' % result['exceptionDetails'].get('text'))
+            timing = result['result']['value']
+            self.browser_version = info.get('Browser', 'NA').split('/')[-1]
+
+            try:
+                devtools = DevTools(info['webSocketDebuggerUrl'])
+                devtools.send('Browser.close')
+                devtools.close()
+            except (DevToolsError, OSError):
+                # browser may drop the connection before it replies, and is killed below if it does not exit
+                pass
+            try:
+                process.wait(30)
+            except subprocess.TimeoutExpired:
+                Util.warning('Browser does not exit within 30s')
+                return None
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+
+        navigation = timing['timeOrigin'] - time_spawn * 1000
+        return {
+            'devtools': round((time_devtools - time_spawn) * 1000, 1),
+            'navigation': round(navigation, 1),
+            'commit': round(navigation + timing['commit'], 1),
+            'firstPaint': round(navigation + timing['firstPaint'], 1),
+            'firstContentfulPaint': round(navigation + timing['firstContentfulPaint'], 1),
+        }
+
+    # Linux needs root to write drop_caches, macOS needs root to purge, and Windows needs administrator to purge the
+    # standby list. Pages mapped by running processes stay in cache.
+    def drop_cache(self):
+        if not self.drop_permitted:
+            return False
+        try:
+            if Util.HOST_OS == Util.LINUX:
+                os.sync()
+                f = open('/proc/sys/vm/drop_caches', 'w')
+                f.write('3')
+                f.close()
+            elif Util.HOST_OS == Util.DARWIN:
+                if subprocess.call(['purge'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL):
+                    raise Exception('purge failed')
+            elif Util.HOST_OS == Util.WINDOWS:
+                self._purge_standby_list()
+            else:
+                raise Exception('not supported on %s' % Util.HOST_OS)
+        except Exception as e:
+            Util.warning('Could not drop page cache: %s' % e)
+            self.drop_permitted = False
+        return self.drop_permitted
+
+    # Standby list of Windows holds the pages of files read before, which NtSetSystemInformation purges with
+    # SeProfileSingleProcessPrivilege
+    @staticmethod
+    def _purge_standby_list():
+        class LUID(ctypes.Structure):
+            _fields_ = [('LowPart', ctypes.c_uint32), ('HighPart', ctypes.c_int32)]
+
+        class TOKEN_PRIVILEGES(ctypes.Structure):
+            _fields_ = [('PrivilegeCount', ctypes.c_uint32), ('Luid', LUID), ('Attributes', ctypes.c_uint32)]
+
+        TOKEN_ADJUST_PRIVILEGES = 0x20
+        TOKEN_QUERY = 0x8
+        SE_PRIVILEGE_ENABLED = 0x2
+        ERROR_NOT_ALL_ASSIGNED = 1300
+        SYSTEM_MEMORY_LIST_INFORMATION = 80
+        MEMORY_PURGE_STANDBY_LIST = 4
+
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        advapi32 = ctypes.WinDLL('advapi32', use_last_error=True)
+        ntdll = ctypes.WinDLL('ntdll')
+        kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+        token = ctypes.c_void_p()
+        if not advapi32.OpenProcessToken(ctypes.c_void_p(kernel32.GetCurrentProcess()), TOKEN_ADJUST_PRIVILEGES | TOKEN_QUERY, ctypes.byref(token)):
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            privileges = TOKEN_PRIVILEGES(1, LUID(), SE_PRIVILEGE_ENABLED)
+            if not advapi32.LookupPrivilegeValueW(None, 'SeProfileSingleProcessPrivilege', ctypes.byref(privileges.Luid)):
+                raise ctypes.WinError(ctypes.get_last_error())
+            # it succeeds without the privilege assigned, which is told by the last error
+            if not advapi32.AdjustTokenPrivileges(token, False, ctypes.byref(privileges), 0, None, None) or ctypes.get_last_error() == ERROR_NOT_ALL_ASSIGNED:
+                raise Exception('SeProfileSingleProcessPrivilege is not held, run as administrator')
+        finally:
+            kernel32.CloseHandle(token)
+
+        command = ctypes.c_int(MEMORY_PURGE_STANDBY_LIST)
+        status = ntdll.NtSetSystemInformation(SYSTEM_MEMORY_LIST_INFORMATION, ctypes.byref(command), ctypes.sizeof(command))
+        if status:
+            raise Exception('NtSetSystemInformation fails with status 0x%x' % (status & 0xFFFFFFFF))
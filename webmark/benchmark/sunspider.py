@@ -50,9 +50,6 @@ class sunspider(Benchmark):
             return False
 
     def act0(self, driver):
-        text = self.driver.find_element_by_id('console').text
-        pos = text.find('Total:') + len('Total:')
-        text = text[pos:].strip()
-        pos = text.find('ms')
-
-        self.result.append(text[:pos])
+        total, subs = self.get_console_result(self.driver.find_element_by_id('console').text)
+        self.result.append(total)
+        self.extra['subs'] = subs
@@ -0,0 +1,120 @@
+import csv
+import glob
+import os
+import subprocess
+import time
+
+from util.base import * # pylint: disable=unused-wildcard-import
+
+# Wait for temperature and cpu load to return to the idle baseline, which is recorded at first use, and for cpu
+# frequency to be no longer throttled below its maximum, or below the idle limit if that is lower. Linux reads them
+# from /sys and /proc, and Windows reads load and frequency from performance counters through typeperf. It does nothing
+# on other platforms.
+class Cooldown(object):
+    def __init__(self, temp_margin=3, freq_margin=0.05, load_margin=5, interval=2):
+        # degree Celsius, ratio of maximum frequency, and cpu load in percent
+        self.temp_margin = temp_margin
+        self.freq_margin = freq_margin
+        self.load_margin = load_margin
+        self.interval = interval
+        self.baseline = None
+        self.typeperf = True
+
+    def get_state(self):
+        if Util.HOST_OS == Util.WINDOWS:
+            return self._get_state_windows()
+        if not os.path.exists('/proc/stat'):
+            return {}
+
+        state = {'load': self._get_load()}
+        temps = []
+        for zone in glob.glob('/sys/class/thermal/thermal_zone*/temp'):
+            try:
+                temps.append(int(open(zone).read()) / 1000.0)
+            except Exception:
+                pass
+        if temps:
+            state['temp'] = max(temps)
+
+        # frequency limit of the most throttled cpu in percent of its maximum, as thermal drivers lower scaling_max_freq
+        freqs = []
+        for cpu in glob.glob('/sys/devices/system/cpu/cpu*/cpufreq'):
+            try:
+                freqs.append(100.0 * int(open('%s/scaling_max_freq' % cpu).read()) / int(open('%s/cpuinfo_max_freq' % cpu).read()))
+            except Exception:
+                pass
+        if freqs:
+            state['freq'] = round(min(freqs), 1)
+        return state
+
+    # % Performance Limit is the frequency limit in percent of the nominal one, which drops when cpu is throttled
+    def _get_state_windows(self):
+        counters = ['\\Processor(_Total)\\% Processor Time', '\\Processor Information(_Total)\\% Performance Limit']
+        if not self.typeperf:
+            return {}
+        try:
+            out = subprocess.check_output(['typeperf', '-sc', '1'] + counters, stderr=subprocess.DEVNULL).decode('utf-8', 'ignore')
+        except Exception as e:
+            Util.warning('Could not get state from typeperf, cooldown is skipped: %s' % e)
+            self.typeperf = False
+            return {}
+        # a header row of counter names and a row of values, both quoted
+        rows = [row for row in csv.reader(out.splitlines()) if len(row) == len(counters) + 1]
+        state = {}
+        if len(rows) < 2:
+            return state
+        for key, value in zip(['load', 'freq'], rows[-1][1:]):
+            try:
+                state[key] = round(float(value), 1)
+            except ValueError:
+                pass
+        return state
+
+    def record_baseline(self):
+        self.baseline = self.get_state()
+        Util.info('Idle baseline: %s' % self.baseline)
+
+    # return seconds waited and the state when it ends
+    def wait(self, timeout):
+        if self.baseline is None:
+            self.record_baseline()
+        time_start = time.time()
+        while True:
+            state = self.get_state()
+            if self._is_idle(state):
+                break
+            if time.time() - time_start >= timeout:
+                Util.warning('Could not cool down to baseline in %ss, state: %s' % (timeout, state))
+                break
+            time.sleep(self.interval)
+        waited = round(time.time() - time_start, 1)
+        Util.info('Cooldown waited %ss, state: %s' % (waited, state))
+        return waited, state
+
+    def _is_idle(self, state):
+        baseline = self.baseline
+        if 'temp' in state and 'temp' in baseline and state['temp'] > baseline['temp'] + self.temp_margin:
+            return False
+        # idle limit below maximum, such as without turbo or on battery, is not throttling
+        if 'freq' in state and state['freq'] < min(100, baseline.get('freq', 100)) * (1 - self.freq_margin):
+            return False
+        if 'load' in state and 'load' in baseline and state['load'] > baseline['load'] + self.load_margin:
+            return False
+        return True
+
+    # cpu load in percent over a short period, from /proc/stat
+    def _get_load(self, period=0.5):
+        def _read():
+            values = [int(x) for x in open('/proc/stat').readline().split()[1:]]
+            # idle and iowait
+            return sum(values), values[3] + values[4]
+
+        total_start, idle_start = _read()
+        time.sleep(period)
+        total_end, idle_end = _read()
+        if total_end == total_start:
+            return 0.0
+        return round(100.0 * (1 - float(idle_end - idle_start) / (total_end - total_start)), 1)
+
+# shared by all cases, so that baseline is recorded once before the first case
+cooldown = Cooldown()
@@ -0,0 +1,18 @@
+// Show the FPS reported by jPerf.CSSFPSMeter in #css-fps, which is read by CssBenchmark.
+(function() {
+  var cssFpsElement = document.createElement('div');
+  var style = 'float:left; width:800px; height:30px: color:red;';
+  cssFpsElement.setAttribute('style', style);
+  cssFpsElement.setAttribute('id', 'css-fps');
+  cssFpsElement.innerHTML = 'Recent FPS: 0, Average FPS: 0';
+  document.body.appendChild(cssFpsElement);
+
+  var cssFpsMeter = new window.jPerf.CSSFPSMeter();
+  cssFpsMeter.start();
+  document.addEventListener('CSSFPSReport',
+    function(event) {
+      cssFpsElement.innerHTML = 'Recent FPS: ' + event.recentFPS + ', Average FPS: ' + event.averageFPS;
+    },
+    false
+  );
+})();
@@ -0,0 +1,15 @@
+// Record frame intervals into a ring buffer, which is read in batches by Benchmark.get_frame_time.
+(function() {
+  var frame = window.webmarkFrame = {times: new Float32Array(4096), count: 0, read: 0, last: 0};
+  var tick = function(now) {
+    if (frame.last) {
+      frame.times[frame.count % frame.times.length] = now - frame.last;
+      frame.count++;
+    }
+    frame.last = now;
+    if (window.webmarkFrame === frame) {
+      requestAnimationFrame(tick);
+    }
+  };
+  requestAnimationFrame(tick);
+})();
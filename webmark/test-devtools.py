@@ -0,0 +1,323 @@
+import base64
+import hashlib
+import os
+import re
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import unittest
+
+HOST_OS = sys.platform
+if HOST_OS == 'win32':
+    lines = subprocess.Popen('dir %s' % __file__.replace('/', '\\'), shell=True, stdout=subprocess.PIPE).stdout.readlines()
+    for line in lines:
+        match = re.search(r'\[(.*)\]', line.decode('utf-8'))
+        if match:
+            script_dir = os.path.dirname(match.group(1)).replace('\\', '/')
+            break
+    else:
+        script_dir = sys.path[0]
+else:
+    lines = subprocess.Popen('ls -l %s' % __file__, shell=True, stdout=subprocess.PIPE).stdout.readlines()
+    for line in lines:
+        match = re.search(r'.* -> (.*)', line.decode('utf-8'))
+        if match:
+            script_dir = os.path.dirname(match.group(1))
+            break
+    else:
+        script_dir = sys.path[0]
+
+sys.path.append(script_dir)
+sys.path.append(script_dir + '/..')
+
+from util.base import * # pylint: disable=unused-wildcard-import
+from benchmark.devtools import *
+from benchmark.benchmark import Benchmark
+
+# A websocket server on localhost that serves one connection, and plays the frames of a test
+class FakeServer(object):
+    GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+    def __init__(self, handler, status='101 Switching Protocols'):
+        self.handler = handler
+        self.status = status
+        self.error = None
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(1)
+        self.url = 'ws://127.0.0.1:%s/devtools/page/test' % self.sock.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def join(self):
+        self.thread.join(5)
+        self.sock.close()
+        if self.error:
+            raise self.error
+
+    def send_frame(self, opcode, payload, fin=True):
+        header = struct.pack('!B', (0x80 if fin else 0) | opcode)
+        length = len(payload)
+        if length < 126:
+            header += struct.pack('!B', length)
+        elif length < 65536:
+            header += struct.pack('!BH', 126, length)
+        else:
+            header += struct.pack('!BQ', 127, length)
+        self.conn.sendall(header + payload)
+
+    def send_json(self, message, fin=True):
+        self.send_frame(DevTools.OPCODE_TEXT, json.dumps(message).encode('utf-8'), fin)
+
+    # return opcode and payload of a frame from client, which must be masked
+    def recv_frame(self):
+        head, length = struct.unpack('!BB', self._recv_exact(2))
+        if not length & 0x80:
+            raise Exception('Client frame is not masked')
+        length &= 0x7F
+        if length == 126:
+            length = struct.unpack('!H', self._recv_exact(2))[0]
+        elif length == 127:
+            length = struct.unpack('!Q', self._recv_exact(8))[0]
+        mask = self._recv_exact(4)
+        payload = bytearray(self._recv_exact(length))
+        for i in range(length):
+            payload[i] ^= mask[i % 4]
+        return head & 0x0F, bytes(payload)
+
+    def recv_json(self):
+        opcode, payload = self.recv_frame()
+        if opcode != DevTools.OPCODE_TEXT:
+            raise Exception('Expect a text frame, but opcode is %s' % opcode)
+        return json.loads(payload.decode('utf-8'))
+
+    def _serve(self):
+        try:
+            self.conn = self.sock.accept()[0]
+            self.conn.settimeout(5)
+            self.buffer = b''
+            while b'\r\n\r\n' not in self.buffer:
+                self._recv()
+            request = self.buffer.decode('utf-8')
+            self.buffer = b''
+            key = re.search(r'Sec-WebSocket-Key: (\S+)', request).group(1)
+            accept = base64.b64encode(hashlib.sha1((key + self.GUID).encode('utf-8')).digest()).decode('utf-8')
+            response = 'HTTP/1.1 %s\r\nUpgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Accept: %s\r\n\r\n' % (self.status, accept)
+            self.conn.sendall(response.encode('utf-8'))
+            if self.handler:
+                self.handler(self)
+        except Exception as e:
+            self.error = e
+        finally:
+            try:
+                self.conn.close()
+            except Exception:
+                pass
+
+    def _recv_exact(self, count):
+        while len(self.buffer) < count:
+            self._recv()
+        data = self.buffer[:count]
+        self.buffer = self.buffer[count:]
+        return data
+
+    def _recv(self):
+        data = self.conn.recv(1 << 16)
+        if not data:
+            raise Exception('Client closes connection')
+        self.buffer += data
+
+class DevToolsTest(unittest.TestCase):
+    def run_server(self, handler, status='101 Switching Protocols'):
+        server = FakeServer(handler, status)
+        self.addCleanup(server.join)
+        return server
+
+    def test_fragmented_frames(self):
+        def handler(server):
+            request = server.recv_json()
+            payload = json.dumps({'id': request['id'], 'result': {'value': 'fragmented'}}).encode('utf-8')
+            server.send_frame(DevTools.OPCODE_TEXT, payload[:5], fin=False)
+            server.send_frame(DevTools.OPCODE_CONTINUATION, payload[5:10], fin=False)
+            server.send_frame(DevTools.OPCODE_CONTINUATION, payload[10:])
+
+        devtools = DevTools(self.run_server(handler).url, 5)
+        self.assertEqual(devtools.send('Runtime.evaluate'), {'value': 'fragmented'})
+        devtools.close()
+
+    def test_extended_lengths(self):
+        def handler(server):
+            for size in [200, 70000]:
+                request = server.recv_json()
+                self.assertEqual(len(request['params']['data']), size)
+                server.send_json({'id': request['id'], 'result': {'data': request['params']['data']}})
+
+        devtools = DevTools(self.run_server(handler).url, 5)
+        # 16 and 64 bit lengths, in both directions
+        for size in [200, 70000]:
+            data = 'x' * size
+            self.assertEqual(devtools.send('IO.read', {'data': data})['data'], data)
+        devtools.close()
+
+    def test_ping_inside_message(self):
+        def handler(server):
+            request = server.recv_json()
+            payload = json.dumps({'id': request['id'], 'result': {}}).encode('utf-8')
+            server.send_frame(DevTools.OPCODE_TEXT, payload[:4], fin=False)
+            server.send_frame(DevTools.OPCODE_PING, b'ping')
+            server.send_frame(DevTools.OPCODE_CONTINUATION, payload[4:])
+            self.assertEqual(server.recv_frame(), (DevTools.OPCODE_PONG, b'ping'))
+
+        devtools = DevTools(self.run_server(handler).url, 5)
+        self.assertEqual(devtools.send('Page.enable'), {})
+        devtools.close()
+
+    def test_events_interleaved_with_replies(self):
+        def handler(server):
+            request = server.recv_json()
+            server.send_json({'method': 'Tracing.dataCollected', 'params': {'value': [1]}})
+            server.send_json({'method': 'Page.loadEventFired', 'params': {}})
+            server.send_json({'id': request['id'], 'result': {'first': True}})
+            request = server.recv_json()
+            server.send_json({'method': 'Tracing.dataCollected', 'params': {'value': [2]}})
+            server.send_json({'id': request['id'], 'result': {'second': True}})
+            server.send_json({'method': 'Tracing.tracingComplete', 'params': {'stream': '1'}})
+
+        devtools = DevTools(self.run_server(handler).url, 5)
+        self.assertEqual(devtools.send('Tracing.start'), {'first': True})
+        self.assertEqual(devtools.send('Tracing.end'), {'second': True})
+        # events received while waiting for replies are kept in order, and the others are read on demand
+        self.assertEqual(devtools.wait_event('Page.loadEventFired')['params'], {})
+        self.assertEqual(devtools.wait_event('Tracing.tracingComplete')['params'], {'stream': '1'})
+        self.assertEqual(devtools.wait_event('Tracing.dataCollected')['params'], {'value': [1]})
+        self.assertEqual(devtools.wait_event('Tracing.dataCollected')['params'], {'value': [2]})
+        devtools.close()
+
+    def test_error_reply(self):
+        def handler(server):
+            request = server.recv_json()
+            server.send_json({'id': request['id'], 'error': {'code': -32601, 'message': 'not found'}})
+
+        devtools = DevTools(self.run_server(handler).url, 5)
+        with self.assertRaisesRegex(DevToolsError, 'not found'):
+            devtools.send('Unknown.method')
+        devtools.close()
+
+    def test_close_frame(self):
+        def handler(server):
+            server.recv_json()
+            server.send_frame(DevTools.OPCODE_CLOSE, b'')
+
+        devtools = DevTools(self.run_server(handler).url, 5)
+        with self.assertRaisesRegex(DevToolsError, 'closed'):
+            devtools.send('Page.enable')
+        devtools.close()
+
+    def test_wait_event_timeout(self):
+        def handler(server):
+            server.send_json({'method': 'Tracing.dataCollected', 'params': {}})
+            # keep connection until client gives up
+            try:
+                server.recv_frame()
+            except Exception:
+                pass
+
+        devtools = DevTools(self.run_server(handler).url, 5)
+        with self.assertRaisesRegex(DevToolsError, 'Tracing.tracingComplete'):
+            devtools.wait_event('Tracing.tracingComplete', 0.5)
+        devtools.close()
+
+    def test_connection_lost(self):
+        def handler(server):
+            server.recv_json()
+
+        devtools = DevTools(self.run_server(handler).url, 5)
+        with self.assertRaises(DevToolsError):
+            devtools.send('Page.enable')
+        devtools.close()
+
+    def test_failed_handshake(self):
+        with self.assertRaises(DevToolsError):
+            DevTools(self.run_server(None, '404 Not Found').url, 5)
+        with self.assertRaises(DevToolsError):
+            DevTools('http://127.0.0.1:9222/devtools/page/test')
+        # nothing listens on the port
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        with self.assertRaises(DevToolsError):
+            DevTools('ws://127.0.0.1:%s/devtools/page/test' % port, 5)
+
+# Scripts of benchmark with transport devtools go through Runtime.evaluate of page
+class ScriptTest(unittest.TestCase):
+    def get_benchmark(self, handler):
+        server = FakeServer(handler)
+        self.addCleanup(server.join)
+        benchmark = Benchmark.__new__(Benchmark)
+        benchmark.transport = 'devtools'
+        benchmark.page_devtools = DevTools(server.url, 5)
+        self.addCleanup(benchmark.page_devtools.close)
+        return benchmark
+
+    def test_execute_script(self):
+        def handler(server):
+            request = server.recv_json()
+            self.assertEqual(request['method'], 'Runtime.evaluate')
+            self.assertEqual(request['params']['awaitPromise'], False)
+            self.assertEqual(request['params']['returnByValue'], True)
+            self.assertIn('apply(null, [1, "a"])', request['params']['expression'])
+            server.send_json({'id': request['id'], 'result': {'result': {'type': 'number', 'value': 3}}})
+            request = server.recv_json()
+            # undefined has no value
+            server.send_json({'id': request['id'], 'result': {'result': {'type': 'undefined'}}})
+
+        benchmark = self.get_benchmark(handler)
+        self.assertEqual(benchmark.execute_script(None, 'return arguments[0] + 2', 1, 'a'), 3)
+        self.assertIsNone(benchmark.execute_script(None, 'window.x = 1'))
+
+    def test_execute_async_script(self):
+        def handler(server):
+            request = server.recv_json()
+            self.assertEqual(request['params']['awaitPromise'], True)
+            self.assertIn('new Promise', request['params']['expression'])
+            self.assertIn('[2].concat([resolve])', request['params']['expression'])
+            server.send_json({'id': request['id'], 'result': {'result': {'type': 'object', 'value': {'score': 2}}}})
+
+        benchmark = self.get_benchmark(handler)
+        self.assertEqual(benchmark.execute_async_script(None, 'arguments[1]({score: arguments[0]})', 10, 2), {'score': 2})
+
+    def test_exception_details(self):
+        def handler(server):
+            request = server.recv_json()
+            server.send_json({'id': request['id'], 'result': {
+                'result': {'type': 'object', 'subtype': 'error'},
+                'exceptionDetails': {'text': 'Uncaught', 'exception': {'description': 'ReferenceError: foo is not defined'}},
+            }})
+            request = server.recv_json()
+            server.send_json({'id': request['id'], 'result': {'result': {'type': 'object'}, 'exceptionDetails': {'text': 'Uncaught (in promise)'}}})
+
+        benchmark = self.get_benchmark(handler)
+        with self.assertRaisesRegex(Exception, 'ReferenceError: foo is not defined'):
+            benchmark.execute_script(None, 'return foo')
+        with self.assertRaisesRegex(Exception, r'Uncaught \(in promise\)'):
+            benchmark.execute_async_script(None, 'Promise.reject()', 10)
+
+    def test_wait_script(self):
+        def handler(server):
+            for value in [True, False]:
+                request = server.recv_json()
+                self.assertEqual(request['params']['awaitPromise'], True)
+                self.assertIn('document.readyState', request['params']['expression'])
+                server.send_json({'id': request['id'], 'result': {'result': {'type': 'boolean', 'value': value}}})
+
+        benchmark = self.get_benchmark(handler)
+        benchmark.wait_script(None, 'return document.readyState == "complete"', 1)
+        with self.assertRaisesRegex(Exception, 'Timeout to wait for script'):
+            benchmark.wait_script(None, 'return document.readyState == "complete"', 1)
+
+if __name__ == '__main__':
+    unittest.main()
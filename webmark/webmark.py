@@ -1,8 +1,12 @@
+import importlib
+import itertools
+import math
 import os
 import platform
 import re
 import subprocess
 import sys
+import tempfile
 
 HOST_OS = sys.platform
 if HOST_OS == 'win32':
@@ -28,16 +32,27 @@ sys.path.append(script_dir)
 sys.path.append(script_dir + '/..')
 
 from util.base import * # pylint: disable=unused-wildcard-import
+from benchmark.dashboard import *
+from benchmark.export import *
+from benchmark.profile import *
 
 result_file = ''
+record_file = ''
+histogram_exporter = None
 
 class Webmark():
     def __init__(self):
         global result_file
+        global record_file
+        global histogram_exporter
 
         self._parse_args()
         args = self.program.args
 
+        if args.export:
+            HistogramExporter.export(args.export, '%s.histograms.json' % os.path.splitext(args.export)[0])
+            return
+
         config_file = args.config
         if not os.path.isfile(config_file):
             Util.error(config_file + ' is not a valid file')
@@ -47,18 +62,36 @@ class Webmark():
 
         result_file = '%s/%s.txt' % (ScriptRepo.IGNORE_WEBMARK_RESULT_DIR, self.program.timestamp)
         Util.ensure_file(result_file)
+        record_file = '%s/%s.json' % (ScriptRepo.IGNORE_WEBMARK_RESULT_DIR, self.program.timestamp)
+        Util.ensure_file(record_file)
+
+        if args.dashboard_port:
+            dashboard.start(args.dashboard_port)
+
+        if args.histogram:
+            histogram_exporter = HistogramExporter('%s/%s.histograms.json' % (ScriptRepo.IGNORE_WEBMARK_RESULT_DIR, self.program.timestamp))
 
-        Suites(data).run()
+        # close histogram file even if run exits on error, so that it's still valid json
+        try:
+            Suites(data).run()
+        finally:
+            if histogram_exporter:
+                histogram_exporter.close()
 
     def _parse_args(self):
         parser = argparse.ArgumentParser(description='Automation tool to measure the performance of browser and web runtime with benchmarks')
         parser.epilog='''
 examples:
 {0} {1} --config config.json
+{0} {1} --config config.json --dashboard-port 8000
+{0} {1} --export result.json
 '''.format(Util.PYTHON, parser.prog)
 
         parser.add_argument('--config', dest='config', help='config file to put in all the configurations')
         parser.add_argument('--dryrun', dest='codryrunnfig', help='dryrun')
+        parser.add_argument('--histogram', dest='histogram', help='export results as HistogramSet json of perf dashboard while running', action='store_true')
+        parser.add_argument('--export', dest='export', help='export a json record file of previous run as HistogramSet json, without running')
+        parser.add_argument('--dashboard-port', dest='dashboard_port', help='port of live dashboard, which is disabled by default', type=int, default=0)
         self.program = Program(parser)
 
 class Suites():
@@ -81,35 +114,164 @@ class Browser():
         ['path', 'O', 'P'],
         ['options', 'O', 'P'],
         ['webdriver_path', 'O', 'P'],
+        # template to give each case a clone of warmed profile, or empty to use the default one of webdriver
+        ['profile', 'O', 'P'],
     ]
 
     def __init__(self, data):
         self.data = data
         Format.format(self)
 
+    def get_webdriver(self, options=''):
+        options = ' '.join([x for x in [self.options, options] if x])
+        return Util.get_webdriver(browser_name=self.name, browser_path=self.path, browser_options=options, webdriver_path=self.webdriver_path)
+
 class Suite():
     FORMAT = [
         ['name', 'O', 'P'],
         ['description', 'O', 'P'],
         ['browser', 'M', 'O'],
         ['cases', 'M', 'A'],
+        # {"flags": ["--flag-a", "--flag-b"], "mode": "factorial" or "single"}
+        ['flag_sweep', 'O', 'P'],
     ]
 
     def __init__(self, data):
         self.data = data
         self.cases = []
         Format.format(self)
+        # cases such as startup launch the browser by themselves
+        for case in self.cases:
+            case.browser = self.browser
+
+    # two-sided 95% t values for degrees of freedom 1 to 10
+    T95 = [12.71, 4.30, 3.18, 2.78, 2.57, 2.45, 2.36, 2.31, 2.26, 2.23]
 
     def run(self):
         if Util.HOST_OS == Util.WINDOWS:
-            webdriver = Util.get_webdriver(browser_name=self.browser.name, browser_path=self.browser.path, browser_options=self.browser.options, webdriver_path=self.browser.webdriver_path)
-            for case in self.cases:
-                case.run(webdriver)
+            if self.flag_sweep:
+                self._run_flag_sweep()
+                return
+
+            if self.browser.profile == 'template':
+                template = ProfileTemplate(self.browser)
+                for case in self.cases:
+                    profile_dir = template.clone()
+                    webdriver = None
+                    if case.needs_webdriver():
+                        webdriver = self.browser.get_webdriver('--user-data-dir=%s' % profile_dir)
+                    case.run(webdriver)
+                    self._quit_webdriver(webdriver)
+                    shutil.rmtree(profile_dir, ignore_errors=True)
+                return
+
+            self._run_cases()
+
+    # Cases such as startup launch the browser by themselves, so the browser of webdriver is closed before them, as it
+    # would keep binaries of the same build in memory, and it's started again for the next case that needs it
+    def _run_cases(self, options='', flags=None):
+        records = []
+        webdriver = None
+        for case in self.cases:
+            if case.needs_webdriver():
+                if not webdriver:
+                    webdriver = self.browser.get_webdriver(options)
+            elif webdriver:
+                self._quit_webdriver(webdriver)
+                webdriver = None
+            records.append(case.run(webdriver, flags))
+        self._quit_webdriver(webdriver)
+        return records
+
+    @staticmethod
+    def _quit_webdriver(webdriver):
+        if not webdriver:
+            return
+        try:
+            webdriver.quit()
+        except Exception:
+            pass
+
+    # Run all the cases with each flag set in its own profile, then rank flag sets by effect against the one without flags
+    def _run_flag_sweep(self):
+        flags = self.flag_sweep['flags']
+        mode = self.flag_sweep.get('mode', 'single')
+        flag_sets = [[]]
+        if mode == 'factorial':
+            for count in range(1, len(flags) + 1):
+                flag_sets += [list(x) for x in itertools.combinations(flags, count)]
+        elif mode == 'single':
+            flag_sets += [[x] for x in flags]
+        else:
+            Util.error('flag_sweep mode %s is not supported' % mode)
 
-            try:
-                webdriver.quit()
-            except Exception:
-                pass
+        # confidence interval of effect needs at least 2 rounds of each case
+        for case in self.cases:
+            times_run = case.get_config('times_run', 1)
+            if times_run < 2:
+                Util.warning('%s runs %s round, but flag sweep needs at least 2 rounds, so it runs 2 rounds' % (case.name, times_run))
+                case.times_run = 2
+
+        if self.browser.profile == 'template':
+            template = ProfileTemplate(self.browser)
+        records = []
+        for flag_set in flag_sets:
+            Util.info('Begin to run with flags "%s"' % ' '.join(flag_set))
+            if self.browser.profile == 'template':
+                profile_dir = template.clone()
+            else:
+                profile_dir = tempfile.mkdtemp(prefix='webmark-profile-')
+            records_set = self._run_cases(' '.join(flag_set + ['--user-data-dir=%s' % profile_dir]), flag_set)
+            shutil.rmtree(profile_dir, ignore_errors=True)
+            records.append(records_set)
+
+        lines = []
+        for index, case in enumerate(self.cases):
+            record_base = records[0][index]
+            effects = []
+            for flag_set, records_set in zip(flag_sets[1:], records[1:]):
+                effect, interval = self._get_effect(record_base, records_set[index])
+                effects.append([flag_set, effect, interval])
+            # the best flag set comes first, considering the direction of metric
+            reverse = not record_base['metric'].endswith('(-)')
+            effects = sorted(effects, key=lambda x: x[1], reverse=reverse)
+            for rank, (flag_set, effect, interval) in enumerate(effects):
+                lines.append('Flag result: %s,%s,%s,%s%%,%s' % (record_base['name'], rank + 1, ' '.join(flag_set), effect, interval))
+
+        f = open(result_file, 'a+')
+        for line in lines:
+            Util.info(line)
+            f.write(line + '\n')
+        f.close()
+
+    # Relative change in percent of the mean of per-round first result, and its 95% confidence interval by Welch's t-test
+    def _get_effect(self, record_base, record):
+        samples_base = [x['result'][0] for x in record_base['rounds']]
+        samples = [x['result'][0] for x in record['rounds']]
+        mean_base = sum(samples_base) / len(samples_base)
+        mean = sum(samples) / len(samples)
+        if not mean_base:
+            return 0.0, 'NA'
+        effect = round((mean - mean_base) / mean_base * 100, 2)
+        if len(samples_base) < 2 or len(samples) < 2:
+            return effect, 'NA'
+
+        var_base = sum((x - mean_base) ** 2 for x in samples_base) / (len(samples_base) - 1)
+        var = sum((x - mean) ** 2 for x in samples) / (len(samples) - 1)
+        se2_base = var_base / len(samples_base)
+        se2 = var / len(samples)
+        se = math.sqrt(se2_base + se2)
+        if se:
+            df = int((se2_base + se2) ** 2 / (se2_base ** 2 / (len(samples_base) - 1) + se2 ** 2 / (len(samples) - 1)))
+        else:
+            df = len(samples_base) + len(samples) - 2
+        if df <= len(self.T95):
+            t = self.T95[max(df, 1) - 1]
+        else:
+            t = 1.96
+        low = round((mean - mean_base - t * se) / mean_base * 100, 2)
+        high = round((mean - mean_base + t * se) / mean_base * 100, 2)
+        return effect, '[%s%%|%s%%]' % (low, high)
 
 class Case():
     FORMAT = [
@@ -121,14 +283,35 @@ class Case():
         self.data = data
         Format.format(self)
 
-    def run(self, driver):
+    # member of case overrides the one in CONFIG of benchmark
+    def get_config(self, key, default=None):
+        if hasattr(self, key):
+            return getattr(self, key)
+        module = importlib.import_module('benchmark.' + self.name.lower())
+        return getattr(module, self.name).CONFIG.get(key, default)
+
+    # benchmark launching the browser by itself sets webdriver to False in its CONFIG
+    def needs_webdriver(self):
+        module = importlib.import_module('benchmark.' + self.name.lower())
+        return getattr(module, self.name).CONFIG.get('webdriver', True)
+
+    def run(self, driver, flags=None):
         name = self.name
         exec('from benchmark.' + name.lower() + ' import ' + name)
         benchmark = eval(name)(driver, self)
+        benchmark.result_prefix = os.path.splitext(result_file)[0]
+        benchmark.flags = flags or []
         result = benchmark.run()
         f = open(result_file, 'a+')
         f.write(result + '\n')
         f.close()
+        # one json record per line, with per-round results and auxiliary info
+        f = open(record_file, 'a+')
+        f.write(json.dumps(benchmark.record) + '\n')
+        f.close()
+        if histogram_exporter:
+            histogram_exporter.add(benchmark.record)
+        return benchmark.record
 
 class Format():
     NAME = 0